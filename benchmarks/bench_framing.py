@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the HID framing layer of msr605x.py.
+
+Compares the original bytes-concatenating implementations of
+_encapsulate_message / recv_message ("before") with the preallocated
+packet and reassembly buffers ("after"), without a physical reader:
+packets are sent to and read from an in-memory stand-in for the pyusb
+device. For every case it prints the time per packet, the memory blocks
+allocated per packet and the peak memory allocated while handling one
+message, as measured by tracemalloc.
+
+Blocks are counted from a tracemalloc snapshot taken each time a packet
+crosses the stand-in device: the blocks the framing code has allocated
+during the message and still holds at that point. Temporaries that are
+created and freed between two packets do not show up, so this is a lower
+bound on the allocations per packet.
+
+"after" is the framing code alone; "metrics" is the same call through the
+@timed wrapper that the library puts on recv_message (per message, so it
+weighs most on short replies).
+
+Usage: python benchmarks/bench_framing.py [--messages N]
+"""
+
+import os
+import sys
+import time
+import array
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client_service", "linux"))
+
+import usb._interop  # noqa: E402
+import usb.util  # noqa: E402
+from msr605x import MSR605X, SEQUENCE_END_BIT, SEQUENCE_LENGTH_BITS  # noqa: E402
+from msr605x import __file__ as MSR605X_FILE  # noqa: E402
+
+# recv_message without the @timed metrics wrapper
+recv_message = MSR605X.recv_message.__wrapped__
+
+
+class _Endpoint:
+    """Replays a fixed list of 64-byte packets, converting buffers the way pyusb does."""
+    def __init__(self, packets):
+        self.packets = [array.array('B', packet) for packet in packets]
+        self.index = 0
+        self.on_packet = None
+
+    def read(self, size_or_buffer, timeout=0):
+        packet = self.packets[self.index]
+        self.index = (self.index + 1) % len(self.packets)
+        if isinstance(size_or_buffer, array.array):
+            buff = size_or_buffer
+        else:
+            buff = usb.util.create_buffer(size_or_buffer)
+        buff[:] = packet
+        if self.on_packet is not None:
+            self.on_packet()
+        if isinstance(size_or_buffer, array.array):
+            return len(packet)
+        return buff
+
+
+class _Device:
+    """Accepts packets the way pyusb's ctrl_transfer does (as_array copies non-arrays)."""
+    def __init__(self):
+        self.on_packet = None
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0, data_or_wLength=None, timeout=None):
+        data = usb._interop.as_array(data_or_wLength)
+        if self.on_packet is not None:
+            self.on_packet()
+        return len(data)
+
+
+def _make_msr(packets=None):
+    # Build the object without __init__, which would look for a real device.
+    msr = MSR605X.__new__(MSR605X)
+    msr.dev = _Device()
+    msr.hid_endpoint = _Endpoint(packets or [bytes(64)])
+    msr.invalidate_config()
+    msr._tx_packet = array.array('B', bytes(64))
+    msr._tx_view = memoryview(msr._tx_packet)
+    msr._rx_packet = array.array('B', bytes(64))
+    msr._rx_view = memoryview(msr._rx_packet)
+    msr._rx_message = bytearray()
+    return msr
+
+
+# Original implementations, kept here as the "before" side of the comparison.
+
+def legacy_encapsulate_message(msr, message):
+    idx = 0
+    while idx < len(message):
+        payload = message[idx:idx+63]
+        header = bytes([msr._make_header(idx == 0, len(message) - idx < 64, len(payload))])
+        padding = b"\0" * (63 - len(payload))
+        yield header + payload + padding
+        idx += 63
+
+def legacy_recv_message(msr, timeout=0):
+    message = b""
+    while True:
+        packet = bytes(msr.hid_endpoint.read(64, timeout=timeout))
+        payload_length = packet[0] & SEQUENCE_LENGTH_BITS
+        payload = packet[1:1 + payload_length]
+        message += payload
+        if packet[0] & SEQUENCE_END_BIT:
+            break
+    return message
+
+
+def _frame(msr, message):
+    return [bytes(packet) for packet in msr._encapsulate_message(message)]
+
+class _BlockCounter:
+    """
+    Called by the stand-in device as each packet crosses it: counts the
+    blocks that the framing code (msr605x.py, the legacy functions here and
+    pyusb's buffer helpers) allocated since tracing started and still holds.
+    """
+    def __init__(self, packets):
+        self.filters = [tracemalloc.Filter(True, MSR605X_FILE), tracemalloc.Filter(True, __file__),
+                        tracemalloc.Filter(True, usb.util.__file__), tracemalloc.Filter(True, usb._interop.__file__)]
+        self.counts = [0] * packets  # Preallocated: recording a count must not allocate
+        self.index = 0
+
+    def __call__(self):
+        if self.index < len(self.counts):
+            self.counts[self.index] = len(tracemalloc.take_snapshot().filter_traces(self.filters).traces)
+            self.index += 1
+
+def _measure(label, func, messages, packets_per_message, hooks):
+    # Timing pass
+    start = time.perf_counter()
+    for _ in range(messages):
+        func()
+    elapsed = time.perf_counter() - start
+    # Peak memory pass
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    # Block count pass (the snapshots would distort the peak, so it runs on its own)
+    counter = _BlockCounter(packets_per_message)
+    for hook in hooks:
+        hook.on_packet = counter
+    tracemalloc.start()
+    func()
+    tracemalloc.stop()
+    for hook in hooks:
+        hook.on_packet = None
+    blocks = sum(counter.counts) / packets_per_message
+    per_packet_us = elapsed / (messages * packets_per_message) * 1e6
+    print(f"  {label:<8} {per_packet_us:8.2f} us/pkt {blocks:8.2f} blocks/pkt {peak:10d} B peak/msg")
+
+def bench_send(message, messages):
+    packets = -(-len(message) // 63)
+    print(f"send_message: {len(message)} bytes, {packets} packets")
+    msr = _make_msr()
+
+    def before():
+        for packet in legacy_encapsulate_message(msr, message):
+            msr._send_packet(packet)
+
+    _measure("before", before, messages, packets, [msr.dev])
+    _measure("after", lambda: msr.send_message(message), messages, packets, [msr.dev])
+
+def bench_recv(message, messages):
+    msr = _make_msr()
+    packets = _frame(msr, message)
+    print(f"recv_message: {len(message)} bytes, {len(packets)} packets")
+    msr.hid_endpoint = _Endpoint(packets)
+    assert legacy_recv_message(msr) == message
+    assert msr.recv_message() == message
+    hooks = [msr.hid_endpoint]
+    _measure("before", lambda: legacy_recv_message(msr), messages, len(packets), hooks)
+    _measure("after", lambda: recv_message(msr), messages, len(packets), hooks)
+    _measure("metrics", lambda: msr.recv_message(), messages, len(packets), hooks)
+
+def main():
+    parser = argparse.ArgumentParser(description="MSR605X framing micro-benchmark")
+    parser.add_argument("--messages", type=int, default=20000, help="Messages per case")
+    args = parser.parse_args()
+
+    # A typical ISO read reply, a write command and a long raw mode reply.
+    swipe = b"\x1bs\x1b\x01%B4111111111111111^DOE/JOHN^25121010000000000000?\x1b\x02;4111111111111111=2512101?\x1b\x03;011234567890123445=724724100000000000030300001000000000000000000?\x1c\x1b0"
+    raw = bytes(range(256)) * 32
+    for message in (b"\x1br", swipe, raw):
+        bench_send(message, args.messages)
+    for message in (b"\x1b0", swipe, raw):
+        bench_recv(message, args.messages)
+
+if __name__ == "__main__":
+    main()
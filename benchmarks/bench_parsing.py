@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the read-response parsers of msr605x.py.
+
+Builds a corpus of read responses shaped like captured ESC r replies
+(financial-style track 1/2 data, track 3 present on some cards, some empty
+tracks and some read errors) and times the string-based
+parse_and_clean_tracks() path used so far against the byte-level
+parse_response(). It also counts the responses where the two disagree:
+those are the cases where the string scan picks the wrong start for track 3
+(a '=' inside track 3 data) or shifts track 3 into an empty track 2.
+
+Usage: python benchmarks/bench_parsing.py [--responses N] [--rounds N]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client_service", "linux"))
+
+from msr605x import ESC, FS, parse_and_clean_tracks, parse_response  # noqa: E402
+
+
+def _digits(rng, count):
+    return "".join(rng.choice("0123456789") for _ in range(count))
+
+def make_response(rng):
+    """One read response: ESC s, the three track sections, '?' FS and ESC status."""
+    pan = _digits(rng, 16)
+    expiry = _digits(rng, 4)
+    name = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(rng.randint(4, 20)))
+    track1 = f"%B{pan}^{name}/TEST^{expiry}101{_digits(rng, 20)}?"
+    track2 = f";{pan}={expiry}101{_digits(rng, 12)}?"
+    track3 = f";01{_digits(rng, 40)}={_digits(rng, 20)}?" if rng.random() < 0.3 else ""
+    if rng.random() < 0.05:
+        track2 = ""  # Damaged or unencoded track 2
+    status = b"0" if rng.random() < 0.97 else b"1"
+    return (ESC + b"s" +
+            ESC + b"\x01" + track1.encode() +
+            ESC + b"\x02" + track2.encode() +
+            ESC + b"\x03" + track3.encode() +
+            b"?" + FS + ESC + status)
+
+def make_corpus(count, seed=605):
+    rng = random.Random(seed)
+    return [make_response(rng) for _ in range(count)]
+
+def legacy_parse(response):
+    return parse_and_clean_tracks(response.decode("ascii", errors="ignore"))
+
+def new_parse(response):
+    return parse_response(response)
+
+def time_parser(func, corpus, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for response in corpus:
+            func(response)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(corpus)
+
+def main():
+    parser = argparse.ArgumentParser(description="MSR605X response parser benchmark")
+    parser.add_argument("--responses", type=int, default=20000, help="Responses in the corpus")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds (best one is reported)")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.responses)
+    mismatches = sum(1 for response in corpus if legacy_parse(response) != new_parse(response).as_dict())
+    legacy = time_parser(legacy_parse, corpus, args.rounds)
+    new = time_parser(new_parse, corpus, args.rounds)
+    print(f"corpus: {len(corpus)} responses, {mismatches} parsed differently by the two parsers")
+    print(f"  parse_and_clean_tracks  {legacy * 1e6:8.2f} us/response  {1 / legacy:12.0f} responses/s")
+    print(f"  parse_response          {new * 1e6:8.2f} us/response  {1 / new:12.0f} responses/s")
+    print(f"  speedup                 {legacy / new:8.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the hot paths of the MSR605X stack, runnable without a
+reader: HID framing and reassembly, the read-response parsers, track
+validation, the configuration helpers, full read/write/verify/erase cycles
+against the emulated device (msr605x_emulator.py) and the Flask routes of the
+read, write and broker services.
+
+Every case is called repeatedly for --min-time seconds, split into --rounds
+rounds that alternate between the cases; each call is timed on its own and
+the case reports the throughput (ops/s) and the median and 99th percentile
+latency of its best round. Results can be saved as a baseline and later runs
+compared against it; a case whose throughput fell and whose median latency
+rose by more than --tolerance counts as a regression, and the run exits with
+status 1.
+
+Baselines are only comparable on the same machine and Python version.
+
+Usage:
+  python benchmarks/bench_suite.py                              # run and print
+  python benchmarks/bench_suite.py --save baseline.json         # record a baseline
+  python benchmarks/bench_suite.py --compare baseline.json      # fail on regressions
+  python benchmarks/bench_suite.py --filter device. --min-time 2
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import array
+import platform
+import argparse
+import contextlib
+
+# The services read these at import: emulated readers, claimed for the whole run.
+os.environ["MSR605X_EMULATOR"] = "1"
+os.environ.setdefault("MSR605X_EXCLUSIVE", "1")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client_service", "linux"))
+
+from msr605x import (  # noqa: E402
+    MSR605X, DeviceSession, configure_device, check_tracks, erase_card,
+    get_coercivity_status, parse_and_clean_tracks, parse_response,
+    read_card_data, write_card_data,
+)
+from msr605x_emulator import EmulatedDevice  # noqa: E402
+from bench_parsing import make_corpus  # noqa: E402
+
+# A typical ISO read reply and a long raw mode reply (see bench_framing.py).
+SWIPE = b"\x1bs\x1b\x01%B4111111111111111^DOE/JOHN^25121010000000000000?\x1b\x02;4111111111111111=2512101?\x1b\x03;011234567890123445=724724100000000000030300001000000000000000000?\x1c\x1b0"
+RAW = bytes(range(256)) * 32
+
+CARD = (b"%B4111111111111111^DOE/JOHN^2512101?", b";4111111111111111=2512101?", b";0112345678901234?")
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Register a case. The decorated function does the setup and returns the callable to time."""
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+class _ReplayEndpoint:
+    """Hands out the same framed reply over and over, like pyusb reading into a buffer."""
+    def __init__(self, packets):
+        self.packets = [array.array('B', packet) for packet in packets]
+        self.index = 0
+
+    def read(self, buffer, timeout=0):
+        packet = self.packets[self.index]
+        self.index = (self.index + 1) % len(self.packets)
+        buffer[:] = packet
+        return len(packet)
+
+
+def _connected(**kwargs):
+    msr = MSR605X(dev=EmulatedDevice(card=CARD, **kwargs))
+    msr.connect()
+    msr.reset()
+    return msr
+
+
+# Framing and reassembly
+
+def _encapsulate(message):
+    msr = _connected()
+
+    def run():
+        for _ in msr._encapsulate_message(message):
+            pass
+    return run
+
+def _recv(message):
+    msr = _connected()
+    msr.hid_endpoint = _ReplayEndpoint([bytes(packet) for packet in msr._encapsulate_message(message)])
+    assert msr.recv_message() == message
+    return msr.recv_message
+
+benchmark("framing.encapsulate.command")(lambda: _encapsulate(b"\x1br"))
+benchmark("framing.encapsulate.swipe")(lambda: _encapsulate(SWIPE))
+benchmark("framing.encapsulate.raw")(lambda: _encapsulate(RAW))
+benchmark("framing.recv.status")(lambda: _recv(b"\x1b0"))
+benchmark("framing.recv.swipe")(lambda: _recv(SWIPE))
+benchmark("framing.recv.raw")(lambda: _recv(RAW))
+
+@benchmark("framing.send_message.swipe")
+def _send_message():
+    msr = _connected()
+    msr.dev.handle = lambda message: None  # Measure the host side only
+    return lambda: msr.send_message(SWIPE)
+
+
+# Parsing and validation
+
+def _over_corpus(parse, decode=False):
+    corpus = make_corpus(1000)
+    if decode:
+        corpus = [response.decode("ascii", errors="ignore") for response in corpus]
+    position = [0]
+
+    def run():
+        index = position[0]
+        position[0] = (index + 1) % len(corpus)
+        return parse(corpus[index])
+    return run
+
+benchmark("parsing.parse_response")(lambda: _over_corpus(parse_response))
+benchmark("parsing.parse_and_clean_tracks")(lambda: _over_corpus(parse_and_clean_tracks, decode=True))
+benchmark("validation.check_tracks")(lambda: lambda: check_tracks(*CARD))
+
+
+# Configuration helpers
+
+@benchmark("config.configure_device.cold")
+def _configure_cold():
+    msr = _connected()
+
+    def run():
+        msr.invalidate_config()
+        configure_device(msr, mode="write", coercivity="hi")
+    return run
+
+@benchmark("config.configure_device.cached")
+def _configure_cached():
+    msr = _connected()
+    configure_device(msr, mode="write", coercivity="hi")
+    return lambda: configure_device(msr, mode="write", coercivity="hi")
+
+@benchmark("config.get_coercivity_status.refresh")
+def _coercivity_refresh():
+    msr = _connected()
+    return lambda: get_coercivity_status(msr, refresh=True)
+
+
+# Full cycles on a warm DeviceSession, with an instant swipe
+
+def _session():
+    session = DeviceSession()
+    session.msr = _connected()
+    return session
+
+@benchmark("device.read_cycle")
+def _read_cycle():
+    session = _session()
+    read_card_data(session)
+    return lambda: read_card_data(session)
+
+@benchmark("device.write_cycle")
+def _write_cycle():
+    session = _session()
+    return lambda: write_card_data(*CARD, session=session)
+
+@benchmark("device.write_verify_cycle")
+def _verify_cycle():
+    session = _session()
+    return lambda: write_card_data(*CARD, session=session, verify=True)
+
+@benchmark("device.erase_cycle")
+def _erase_cycle():
+    session = _session()
+    return lambda: session.run(lambda msr: erase_card(msr, 0x07), mode="write")
+
+
+# Flask routes (test client, no sockets)
+
+def _route(module, method, path, **kwargs):
+    service = __import__(module)
+    client = service.app.test_client()
+    call = getattr(client, method)
+
+    def run():
+        response = call(path, **kwargs)
+        assert response.status_code == 200, response.get_data()
+    return run
+
+WRITE_BODY = {"track1": CARD[0].decode(), "track2": CARD[1].decode(), "track3": CARD[2].decode()}
+
+benchmark("flask.read_service.read")(lambda: _route("read_service", "get", "/read"))
+benchmark("flask.write_service.write")(lambda: _route("write_service", "post", "/write", json=WRITE_BODY))
+benchmark("flask.broker.read")(lambda: _route("broker_service", "get", "/read"))
+benchmark("flask.broker.status")(lambda: _route("broker_service", "get", "/status"))
+
+
+def measure(run, min_time, min_calls=20):
+    """
+    Call run() for at least min_time seconds (and min_calls times); returns
+    the sorted per-call durations.
+    """
+    clock = time.perf_counter
+    gc.collect()
+    samples = []
+    deadline = clock() + min_time
+    while len(samples) < min_calls or clock() < deadline:
+        start = clock()
+        run()
+        samples.append(clock() - start)
+    samples.sort()
+    return samples
+
+def summarize(samples):
+    def percentile(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+    return {
+        "ops_per_sec": len(samples) / sum(samples),
+        "p50_us": percentile(0.50) * 1e6,
+        "p99_us": percentile(0.99) * 1e6,
+        "calls": len(samples),
+    }
+
+def run_cases(runs, min_time, rounds):
+    """
+    Measure every case in rounds of min_time / rounds seconds. The rounds
+    take turns across the cases, so a case is sampled over the whole run
+    instead of in one stretch, and each case keeps its fastest round: the one
+    least disturbed by the rest of the machine. Returns {name: summary}.
+    """
+    best = {}
+    for name, run in runs.items():
+        measure(run, min_time / rounds)  # Warm-up: caches, lazy setup, CPU clock
+    for _ in range(rounds):
+        for name, run in runs.items():
+            result = summarize(measure(run, min_time / rounds))
+            if name not in best or result["ops_per_sec"] > best[name]["ops_per_sec"]:
+                best[name] = result
+    return best
+
+def compare(result, baseline, tolerance):
+    """Return a note on how result compares with the baseline, and whether it regressed."""
+    if baseline is None:
+        return "new", False
+    throughput = result["ops_per_sec"] / baseline["ops_per_sec"] - 1
+    latency = result["p50_us"] / baseline["p50_us"] - 1
+    # A slower path costs throughput and median latency alike; requiring both
+    # keeps a burst of noise in one of them from failing the run.
+    regressed = throughput < -tolerance and latency > tolerance
+    note = f"{throughput:+7.1%} ops/s {latency:+7.1%} p50"
+    return (note + "  REGRESSION") if regressed else note, regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="MSR605X benchmark suite")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds to run each case")
+    parser.add_argument("--rounds", type=int, default=5, help="Timing rounds per case (best one is reported)")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Compare with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed loss of ops/s and p50 against the baseline (0.2 = 20%%)")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    args = parser.parse_args()
+
+    cases = [(name, setup) for name, setup in BENCHMARKS if args.filter in name]
+    if args.list:
+        print("\n".join(name for name, _ in cases))
+        return 0
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["cases"]
+
+    # The library reports every step on stdout; keep it out of the table.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        runs = {name: setup() for name, setup in cases}
+        results = run_cases(runs, args.min_time, args.rounds)
+
+    regressions = []
+    print(f"{'case':<38} {'ops/s':>10} {'p50 us':>10} {'p99 us':>10}")
+    for name, result in results.items():
+        line = f"{name:<38} {result['ops_per_sec']:10.0f} {result['p50_us']:10.2f} {result['p99_us']:10.2f}"
+        if args.compare:
+            note, regressed = compare(result, baseline.get(name), args.tolerance)
+            line += f"  {note}"
+            if regressed:
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "cases": results}, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
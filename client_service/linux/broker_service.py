@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Device broker: one service that owns the MSR605X and serves read, write,
+erase and status over a single HTTP surface.
+
+read_service.py and write_service.py each open the reader from their own
+process, so back-to-back read/write flows keep handing the USB interface back
+and forth (and can hit "Resource busy"). The broker holds the interface
+exclusively and runs every device operation from one internal job queue, in
+arrival order, on one device thread.
+
+Endpoints:
+  GET  /read      next swipe, as {"Track 1": ..., "Track 2": ..., "Track 3": ...}
+  POST /write     {"track1", "track2", "track3", "coercivity", "verify"}, as write_service
+  POST /erase     {"tracks": "1" | "2" | "3" | "1,2" | ... | "all"}
+  GET  /status    device, queue and stream state
+  GET  /swipes    Server-Sent Events stream of swipes (see swipe_stream)
+  GET  /metrics   stage latency histograms
+
+Point the agent at it with READ_URL=http://127.0.0.1:5002/read and
+WRITE_URL=http://127.0.0.1:5002/write.
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from flask import Flask, Response, jsonify, request
+from flask_cors import CORS
+from werkzeug.serving import WSGIRequestHandler
+from msr605x import (
+    DeviceSession, SingleFlight, TrackDataError, check_tracks, erase_card,
+    parse_tracks_arg, read_card_data, write_card_data,
+)
+from device_registry import DeviceRegistry
+from metrics import timed, render, CONTENT_TYPE
+from swipe_stream import SwipeBroadcaster, sse_events
+
+BROKER_PORT = int(os.environ.get("BROKER_PORT", "5002"))
+
+class DeviceBroker:
+    """Runs device jobs one at a time, in arrival order, on a dedicated thread."""
+    def __init__(self, session, broadcaster):
+        self.session = session
+        self.broadcaster = broadcaster
+        self.jobs = queue.Queue()
+        self.current = None
+        self.completed = 0
+        self.failed = 0
+        self.flights = SingleFlight()
+        self.thread = threading.Thread(target=self._run, name="msr605x-broker", daemon=True)
+        self.thread.start()
+
+    def submit(self, label, operation):
+        """Queue operation() and return a Future with its result."""
+        future = Future()
+        self.jobs.put((label, operation, future))
+        return future
+
+    def shared(self, label, operation):
+        """
+        Run operation() as a queued job and wait for its result. Callers that
+        arrive while a job with the same label is queued or running get that
+        job's result instead of queueing another one.
+        """
+        return self.flights.do(label, lambda: self.submit(label, operation).result())
+
+    def _run(self):
+        while True:
+            label, operation, future = self.jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.current = label
+            try:
+                # A /swipes stream holds the reader; disarm it for the job.
+                with self.broadcaster.paused():
+                    result = operation()
+            except BaseException as e:
+                self.failed += 1
+                future.set_exception(e)
+            else:
+                self.completed += 1
+                future.set_result(result)
+            finally:
+                self.current = None
+
+    def status(self):
+        msr = self.session.msr
+        return {
+            "connected": msr is not None,
+            "busy": self.current is not None,
+            "current_job": self.current,
+            "queued_jobs": self.jobs.qsize(),
+            "completed_jobs": self.completed,
+            "failed_jobs": self.failed,
+            "streaming": self.broadcaster.active,
+            "config": {
+                "bpc": list(msr.bpc) if msr is not None and msr.bpc else None,
+                "bpi": [hex(value) if value is not None else None for value in msr.bpi] if msr is not None else None,
+                "coercivity": msr.coercivity if msr is not None else None,
+            },
+        }
+
+app = Flask(__name__)
+CORS(app)  # Enable CORS for all routes
+
+# The broker is the only process using the reader, so it keeps the interface claimed.
+registry = DeviceRegistry().watch()
+session = DeviceSession(exclusive=True, registry=registry)
+broadcaster = SwipeBroadcaster(session)
+broker = DeviceBroker(session, broadcaster)
+
+@app.route("/read", methods=["GET"])
+@timed("route.read")
+def read():
+    try:
+        if broadcaster.active:
+            # The reader is already armed for /swipes; take the next swipe from the stream.
+            swipe = broadcaster.next_swipe(timeout=10) or {}
+            data = {name: swipe.get(name, "") for name in ("Track 1", "Track 2", "Track 3")}
+        else:
+            # Concurrent /read calls share one armed read and get the same swipe.
+            data = broker.shared("read", lambda: read_card_data(session))
+        return jsonify(data)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/write", methods=["POST"])
+@timed("route.write")
+def write():
+    try:
+        # Expect JSON payload with keys: track1, track2, track3, and optionally coercivity.
+        data = request.get_json() or {}
+        track1 = data.get("track1", "")
+        track2 = data.get("track2", "")
+        track3 = data.get("track3", "")
+        coercivity = data.get("coercivity", "hi")
+        verify = bool(data.get("verify", False))
+        if not (track1 and track2 and track3):
+            return jsonify({"error": "Missing track data; please supply track1, track2, and track3."}), 400
+        track1, track2, track3 = track1.encode(), track2.encode(), track3.encode()
+        check_tracks(track1, track2, track3)
+
+        result = broker.submit("write", lambda: write_card_data(track1, track2, track3, coercivity, session=session, verify=verify)).result()
+        if not result.success:
+            write_result = result.write if verify else result
+            return jsonify({"error": f"Write failed: {result.describe()}", "status": write_result.status}), 500
+        if verify and not result.verified:
+            # Nothing was read back, or the card does not read back as requested.
+            return jsonify({"error": f"Verification failed: {result.describe()}", "mismatches": result.mismatches}), 500
+        if verify:
+            return jsonify({"message": "Write action completed", "track3": data.get("track3"), "verified": True})
+        return jsonify({"message": "Write action completed", "track3": data.get("track3")})
+    except TrackDataError as e:
+        # Rejected before the device was touched; no swipe was requested.
+        return jsonify({"error": str(e), "problems": e.problems}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/erase", methods=["POST"])
+@timed("route.erase")
+def erase():
+    try:
+        data = request.get_json(silent=True) or {}
+        select_byte = parse_tracks_arg(data.get("tracks", "all"))
+        if select_byte is None:
+            return jsonify({"error": "Invalid tracks specification."}), 400
+        erased = broker.submit("erase", lambda: session.run(lambda msr: erase_card(msr, select_byte), mode="write")).result()
+        if erased:
+            return jsonify({"message": "Erase action completed", "tracks": data.get("tracks", "all")})
+        return jsonify({"error": "Erase failed" if erased is False else "Erase timed out or got no valid response from the reader"}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/status", methods=["GET"])
+def status():
+    return jsonify(broker.status())
+
+@app.route("/swipes", methods=["GET"])
+def swipes():
+    # Server-Sent Events: one "swipe" event per card, until the client disconnects
+    return Response(sse_events(broadcaster), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Stage latency histograms of this process (route, configuration, USB transfers)
+    return render(), 200, {"Content-Type": CONTENT_TYPE}
+
+if __name__ == "__main__":
+    # HTTP/1.1 lets the agent's pooled connections (and their TLS sessions) stay open.
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+    app.run(host="127.0.0.1", port=BROKER_PORT, threaded=True)
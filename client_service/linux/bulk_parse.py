@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Bulk parser for archived raw read responses.
+
+Re-parses a log of raw ESC r responses (the bytes returned by recv_message)
+across a process pool and streams the cleaned records to JSONL, one line per
+response and in input order:
+
+  {"index": 0, "Track 1": "...", "Track 2": "...", "Track 3": "...", "status": 48}
+
+Supported log formats:
+  lines   one response per line (responses never contain a newline byte)
+  length  each response prefixed with its length as a 4-byte big-endian integer
+  hex     one hex-encoded response per line
+
+Progress and the final throughput are reported on stderr.
+
+Usage:
+  python bulk_parse.py swipes.log -o swipes.jsonl
+  python bulk_parse.py swipes.bin --format length --workers 8 -o -
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from msr605x import parse_response
+
+def iter_responses(f, fmt):
+    """Yield the raw responses stored in a binary file object."""
+    if fmt == "length":
+        while True:
+            header = f.read(4)
+            if not header:
+                return
+            if len(header) < 4:
+                raise ValueError("Truncated length prefix at end of log")
+            (length,) = struct.unpack(">I", header)
+            response = f.read(length)
+            if len(response) < length:
+                raise ValueError("Truncated response at end of log")
+            yield response
+    else:
+        for line in f:
+            line = line.rstrip(b"\r\n")
+            if not line:
+                continue
+            yield bytes.fromhex(line.decode("ascii")) if fmt == "hex" else line
+
+def iter_chunks(responses, size):
+    """Group responses into (index of first response, list of responses) chunks."""
+    chunk = []
+    start = 0
+    for response in responses:
+        chunk.append(response)
+        if len(chunk) == size:
+            yield start, chunk
+            start += size
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+def parse_chunk(start, chunk):
+    """Parse one chunk in a worker process; returns the JSONL text and its input size."""
+    lines = []
+    for offset, response in enumerate(chunk):
+        record = parse_response(response)
+        lines.append(json.dumps({
+            "index": start + offset,
+            "Track 1": record.track1,
+            "Track 2": record.track2,
+            "Track 3": record.track3,
+            "status": record.status,
+        }, separators=(",", ":")))
+    lines.append("")
+    return "\n".join(lines), len(chunk), sum(len(response) for response in chunk)
+
+def report(records, size, started, final=False):
+    elapsed = max(time.monotonic() - started, 1e-9)
+    prefix = "Done:" if final else "Progress:"
+    print(f"{prefix} {records} responses in {elapsed:.1f} s, "
+          f"{records / elapsed:.0f} responses/s, {size / elapsed / 1e6:.1f} MB/s", file=sys.stderr, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse archived raw MSR605X read responses to JSONL")
+    parser.add_argument("input", help="Raw response log")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file ('-' for stdout)")
+    parser.add_argument("--format", choices=["lines", "length", "hex"], default="lines", help="Log format")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Responses per worker task")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress reports")
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    records = size = 0
+    started = last_report = time.monotonic()
+    try:
+        with open(args.input, "rb") as f, ProcessPoolExecutor(max_workers=args.workers) as pool:
+            # Keep a bounded number of chunks in flight so memory stays flat on huge logs,
+            # and write results in submission order so the output follows the input.
+            pending = deque()
+            chunks = iter_chunks(iter_responses(f, args.format), args.chunk_size)
+            for start, chunk in chunks:
+                pending.append(pool.submit(parse_chunk, start, chunk))
+                if len(pending) < args.workers * 2:
+                    continue
+                text, count, chunk_size = pending.popleft().result()
+                out.write(text)
+                records += count
+                size += chunk_size
+                if time.monotonic() - last_report >= args.report_every:
+                    report(records, size, started)
+                    last_report = time.monotonic()
+            while pending:
+                text, count, chunk_size = pending.popleft().result()
+                out.write(text)
+                records += count
+                size += chunk_size
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    report(records, size, started, final=True)
+
+if __name__ == "__main__":
+    main()
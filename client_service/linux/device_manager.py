@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Manager for hosts with several MSR605X readers attached.
+
+Every matching reader is enumerated once through a DeviceRegistry and keyed
+by its bus/port path (and serial number, if it has one). Each reader gets its
+own worker thread with a DeviceSession, and all workers take jobs from one
+shared queue, so a read, write or erase goes to whichever reader is free first
+and the number of cards handled in parallel grows with the number of readers.
+
+Example:
+    with DeviceManager() as manager:
+        futures = [manager.read() for _ in range(len(manager.devices))]
+        for future in futures:
+            print(future.result())
+
+Usage:
+  python device_manager.py            # list the attached readers
+  python device_manager.py --read     # read one card on every reader at once
+"""
+
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+
+from msr605x import DeviceNotFoundError, DeviceSession, read_card_data, write_card_data, erase_card, check_tracks
+from device_registry import DeviceRegistry
+
+class DeviceWorker(threading.Thread):
+    """Runs the jobs of the shared queue on one reader."""
+    def __init__(self, key, session, jobs):
+        super().__init__(name=f"msr605x-{key}", daemon=True)
+        self.key = key
+        self.session = session
+        self.jobs = jobs
+        self.busy = False
+        self.completed = 0
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.session.close()
+                return
+            future, operation = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.busy = True
+            try:
+                result = operation(self.session)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                self.busy = False
+                self.completed += 1
+
+class DeviceManager:
+    """
+    Dispatches reader jobs across every attached MSR605X.
+    exclusive is passed on to each DeviceSession. registry is the
+    DeviceRegistry to take the readers from; by default a new one is created
+    with find_kwargs (see find_devices).
+    """
+    def __init__(self, exclusive=True, registry=None, **find_kwargs):
+        self.registry = registry if registry is not None else DeviceRegistry(**find_kwargs)
+        self.jobs = queue.Queue()
+        self.workers = {}
+        for key in self.registry.devices():
+            session = DeviceSession(exclusive=exclusive, registry=self.registry, key=key)
+            self.workers[key] = DeviceWorker(key, session, self.jobs)
+        if not self.workers:
+            raise DeviceNotFoundError("Device not found. Check connection.")
+        for worker in self.workers.values():
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def devices(self):
+        """Keys of the managed readers."""
+        return list(self.workers)
+
+    def status(self):
+        """Per-reader state: whether it is busy and how many jobs it has run."""
+        return {key: {"busy": worker.busy, "completed": worker.completed}
+                for key, worker in self.workers.items()}
+
+    def submit(self, operation):
+        """
+        Queue operation(session) for the next free reader, where session is
+        that reader's DeviceSession. Returns a concurrent.futures.Future.
+        """
+        future = Future()
+        self.jobs.put((future, operation))
+        return future
+
+    def read(self):
+        """Read the next card swiped on any free reader (see read_card_data)."""
+        return self.submit(lambda session: read_card_data(session))
+
+    def write(self, track1, track2, track3, coercivity="hi"):
+        """
+        Write track data (bytes) to the next card swiped on any free reader.
+        The Future's result is a WriteResult. Invalid track data raises
+        TrackDataError here, before a reader is taken.
+        """
+        check_tracks(track1, track2, track3)
+        return self.submit(lambda session: write_card_data(track1, track2, track3, coercivity, session=session))
+
+    def erase(self, select_byte, timeout=10):
+        """
+        Erase the tracks given by select_byte (see erase_card) on any free
+        reader, waiting up to timeout seconds for the swipe. If none comes,
+        erase_card() disarms the reader, so the late swipe cannot answer that
+        reader's next job.
+        """
+        return self.submit(lambda session: session.run(lambda msr: erase_card(msr, select_byte, timeout), mode="write"))
+
+    def close(self):
+        """Stop the workers once the queued jobs are done and release every reader."""
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers.values():
+            worker.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="List or use every attached MSR605X")
+    parser.add_argument("--read", action="store_true", help="Read one card on every reader at the same time")
+    args = parser.parse_args()
+
+    with DeviceManager() as manager:
+        print(f"{len(manager.devices)} reader(s): {', '.join(manager.devices)}")
+        if args.read:
+            futures = [manager.read() for _ in manager.devices]
+            for number, future in enumerate(futures, start=1):
+                print(f"Card {number}: {future.result()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+asyncio front end for the MSR605X library.
+
+pyusb only offers blocking transfers, so AsyncMSR605X runs them on a single
+worker thread per device and waits for swipes in short polling slices. Every
+coroutine can therefore be cancelled (asyncio.timeout(), asyncio.wait_for(),
+task.cancel()) within one slice, and one event loop can drive several readers
+next to the HTTP/WebSocket layer without a thread per waiting request.
+
+Example:
+    async with AsyncMSR605X() as msr:
+        await msr.configure(mode="read")
+        async with asyncio.timeout(10):
+            response = await msr.read_tracks(timeout=0)
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from msr605x import (
+    MSR605X, ESC, WriteResult, build_write_command, configure_device, finalize_device,
+)
+
+# How long a single blocking read may hold the device thread (ms). This is
+# the worst-case delay between a cancellation and the device becoming free.
+POLL_INTERVAL = 100
+
+# Timeout between the packets of a message that has already started (ms).
+PACKET_TIMEOUT = 1000
+
+class AsyncMSR605X:
+    """
+    asyncio wrapper around an MSR605X.
+    Either pass an existing MSR605X as msr, or MSR605X() keyword arguments.
+    """
+    def __init__(self, msr=None, poll_interval=POLL_INTERVAL, **kwargs):
+        self.msr = msr if msr is not None else MSR605X(**kwargs)
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="msr605x")
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _call(self, func, *args, **kwargs):
+        """Run a blocking device call on this device's thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def _disarm(self):
+        """Reset the device after a cancelled swipe wait, without waiting for it."""
+        self._executor.submit(self.msr.reset)
+
+    async def connect(self):
+        """Connect to and reset the device."""
+        await self._call(self.msr.connect)
+        await self._call(self.msr.reset)
+
+    async def close(self):
+        """Release the device and stop its thread."""
+        await self._call(finalize_device, self.msr)
+        self._executor.shutdown(wait=False)
+
+    async def send_message(self, message):
+        """Send a message to the MSR605X."""
+        await self._call(self.msr.send_message, message)
+
+    async def recv_message(self, timeout=0):
+        """
+        Receive a message from the MSR605X.
+        timeout: milliseconds to wait for the message to start, 0 to wait until
+        cancelled. Returns None on timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout / 1000 if timeout else None
+        while True:
+            wait = self.poll_interval
+            if deadline is not None:
+                wait = max(1, min(wait, int((deadline - loop.time()) * 1000)))
+            message = await self._call(self.msr.recv_message, PACKET_TIMEOUT, first_timeout=wait)
+            if message is not None:
+                return message
+            if deadline is not None and loop.time() >= deadline:
+                return None
+
+    async def configure(self, mode=None, coercivity=None):
+        """Apply the BPC/BPI setup and coercivity (see configure_device)."""
+        async with self._lock:
+            return await self._call(configure_device, self.msr, mode, coercivity)
+
+    async def _command(self, command, timeout):
+        """Send a command that waits for a swipe and return the device's reply."""
+        async with self._lock:
+            await self.send_message(command)
+            try:
+                response = await self.recv_message(timeout=timeout)
+            except asyncio.CancelledError:
+                self._disarm()
+                raise
+            if response is None:
+                self._disarm()
+            return response
+
+    async def read_tracks(self, timeout=5000):
+        """Read data from all tracks. Returns the raw response, or None on timeout."""
+        response = await self._command(ESC + b"r", timeout)
+        if response and response.startswith(ESC):
+            return response
+        return None
+
+    async def write_card(self, track1, track2, track3, timeout=10000):
+        """
+        Write the given track data (bytes) to the next swiped card.
+        Returns a WriteResult.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        response = await self._command(build_write_command(track1, track2, track3), timeout)
+        status = response[1] if response and len(response) > 1 else None
+        return WriteResult(status, loop.time() - start)
+
+    async def erase_card(self, select_byte, timeout=10000):
+        """
+        Erase the tracks given by select_byte (see erase_card) on the next
+        swiped card. Returns True on success, False if the device reported a
+        failure and None on an unexpected or missing response.
+        """
+        response = await self._command(ESC + b'c' + bytes([select_byte]), timeout)
+        if response == ESC + b'0':
+            return True
+        elif response == ESC + b'A':
+            return False
+        return None
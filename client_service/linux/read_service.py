@@ -1,18 +1,59 @@
 #!/usr/bin/env python3
-from flask import Flask, jsonify
+import os
+from flask import Flask, Response, jsonify
 from flask_cors import CORS
-from msr605x import read_card_data
+from werkzeug.serving import WSGIRequestHandler
+from msr605x import read_card_data, DeviceSession
+from device_registry import DeviceRegistry
+from metrics import timed, render, CONTENT_TYPE
+from swipe_stream import SwipeBroadcaster, sse_events
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# One device connection for the lifetime of the service. The write service
+# shares the reader, so the USB interface is only held while a request runs
+# unless MSR605X_EXCLUSIVE=1.
+# In that shared (default) mode a warm /read only saves the find, connect and
+# reset: the write service may have changed the settings in between, so every
+# read sends the BPC and three BPI commands again, then ESC a and a 0.5 s
+# wait. Set MSR605X_EXCLUSIVE=1 when this is the only process using the
+# reader, or run broker_service.py instead of the two services, to skip it.
+# The reader's handle comes from a registry that follows hot-plug events, so
+# reconnecting never needs a full bus scan.
+registry = DeviceRegistry().watch()
+session = DeviceSession(exclusive=os.environ.get("MSR605X_EXCLUSIVE") == "1", registry=registry)
+
+# Keeps the reader armed while /swipes clients are connected. The reader (and
+# its USB interface) stays busy until the last client disconnects.
+broadcaster = SwipeBroadcaster(session)
+
 @app.route("/read", methods=["GET"])
+@timed("route.read")
 def read():
     try:
-        data = read_card_data()
+        if broadcaster.active:
+            # The reader is already armed for /swipes; take the next swipe from the stream.
+            swipe = broadcaster.next_swipe(timeout=10) or {}
+            data = {name: swipe.get(name, "") for name in ("Track 1", "Track 2", "Track 3")}
+        else:
+            data = read_card_data(session)
         return jsonify(data)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/swipes", methods=["GET"])
+def swipes():
+    # Server-Sent Events: one "swipe" event per card, until the client disconnects
+    return Response(sse_events(broadcaster), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Stage latency histograms of this process (route, configuration, USB transfers)
+    return render(), 200, {"Content-Type": CONTENT_TYPE}
+
 if __name__ == "__main__":
+    # HTTP/1.1 lets the agent's pooled connections (and their TLS sessions) stay open.
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
     app.run(host="127.0.0.1", port=5000)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Fan-out of swipes from one armed reader to any number of subscribers.
+
+SwipeBroadcaster keeps the reader of a DeviceSession armed (MSR605X.iter_swipes)
+while at least one subscriber is connected and puts every swipe on each
+subscriber's queue. The reader is disarmed and the session released as soon
+as the last subscriber leaves. sse_events() turns a subscription into a
+Server-Sent Events stream for Flask:
+
+    broadcaster = SwipeBroadcaster(session)
+
+    @app.route("/swipes")
+    def swipes():
+        return Response(sse_events(broadcaster), mimetype="text/event-stream")
+"""
+
+import json
+import queue
+import threading
+from contextlib import contextmanager
+
+# Swipes buffered per subscriber; a client that falls further behind misses swipes.
+QUEUE_SIZE = 16
+
+# Seconds between keep-alive comments. A disconnected client is only noticed
+# when a write fails, so this bounds how long the reader stays armed and the
+# interface claimed after the last client has gone.
+HEARTBEAT_INTERVAL = 1.0
+
+# Seconds to wait before re-arming after a device error while subscribers remain.
+RETRY_DELAY = 1.0
+
+class SwipeBroadcaster:
+    """Streams the swipes of one DeviceSession to subscriber queues."""
+    def __init__(self, session, queue_size=QUEUE_SIZE):
+        self.session = session
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.subscribers = set()
+        self.stop = threading.Event()
+        self.thread = None
+        self.pauses = 0
+
+    @property
+    def active(self):
+        """True while the reader is being streamed to at least one subscriber."""
+        with self.lock:
+            return bool(self.subscribers)
+
+    def subscribe(self):
+        """
+        Register a subscriber and arm the reader if it is not armed yet.
+        Returns a queue of (event, data) tuples; event is "swipe" or "error".
+        """
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="msr605x-swipes", daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Remove a subscriber; the reader is disarmed when none are left."""
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            if not self.subscribers:
+                self.stop.set()
+                self.changed.notify_all()
+
+    @contextmanager
+    def paused(self):
+        """
+        Disarm the stream and hold the session for another operation (e.g. a
+        write); the stream is re-armed afterwards if subscribers remain.
+        """
+        with self.lock:
+            self.pauses += 1
+            self.stop.set()
+        try:
+            with self.session.lock:
+                yield
+        finally:
+            with self.lock:
+                self.pauses -= 1
+                self.changed.notify_all()
+
+    def next_swipe(self, timeout=10):
+        """Wait up to timeout seconds for the next swipe; returns its data or None."""
+        subscriber = self.subscribe()
+        try:
+            while True:
+                event, data = subscriber.get(timeout=timeout)
+                if event == "swipe":
+                    return data
+        except queue.Empty:
+            return None
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _publish(self, event, data):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                pass  # Slow client; it misses this swipe
+
+    def _stream(self, msr, stop):
+        for record in msr.iter_swipes(stop_event=stop):
+            self._publish("swipe", {**record.as_dict(), "status": record.status, "ok": record.ok})
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while self.pauses and self.subscribers:
+                    self.changed.wait()
+                if not self.subscribers:
+                    self.thread = None
+                    return
+                stop = self.stop = threading.Event()
+            try:
+                self.session.run(lambda msr: self._stream(msr, stop), mode="read")
+            except Exception as e:
+                self._publish("error", {"error": str(e)})
+                stop.wait(RETRY_DELAY)
+
+def sse_events(broadcaster, heartbeat=HEARTBEAT_INTERVAL):
+    """
+    Generator of Server-Sent Events for one client. The subscription ends
+    when the client disconnects: the next write (a swipe or, at the latest,
+    a keep-alive after heartbeat seconds) fails, the generator is closed and
+    the finally block unsubscribes.
+    """
+    subscriber = broadcaster.subscribe()
+    event_id = 0
+    try:
+        yield "retry: 2000\n\n"
+        while True:
+            try:
+                event, data = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            event_id += 1
+            yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+    finally:
+        broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Tests for msr605x.py against the emulated reader (msr605x_emulator.py).
+
+Run with: python -m pytest client_service
+"""
+
+import threading
+import time
+
+import pytest
+
+from msr605x import (BPI_SETTINGS, ESC, MSR605X, DeviceSession, configure_device, parse_response, read_card_data,
+                     erase_card, write_and_verify, write_card)
+from msr605x_emulator import EmulatedDevice
+
+CARD = (b"%B4111111111111111^DOE/JOHN^2512101?", b";4111111111111111=2512101?", b";0112345678901234?")
+
+
+def _connected(device):
+    msr = MSR605X(dev=device)
+    msr.connect()
+    msr.reset()
+    return msr
+
+def _session(device):
+    session = DeviceSession()
+    session.msr = _connected(device)
+    return session
+
+def _record_commands(device):
+    """List that collects every message the host sends to device."""
+    commands = []
+    handle = device.handle
+
+    def recording(message):
+        commands.append(bytes(message))
+        handle(message)
+    device.handle = recording
+    return commands
+
+
+def _replies(statuses):
+    return {status.label: status.response for status in statuses}
+
+def test_batch_drains_stale_reply_after_reset():
+    device = EmulatedDevice(card=CARD)
+    msr = _connected(device)
+    device.reply(ESC + b"0")  # Late answer to a command given up on before the reset
+    statuses = configure_device(msr, mode="write", coercivity="hi")
+    assert all(status.ok for status in statuses)
+    assert _replies(statuses)["BPC Set"] == ESC + b"0" + device.bpc
+    assert not msr.reply_pending
+    assert device.replies.empty()
+
+def test_batch_without_pending_reply_does_not_wait():
+    msr = _connected(EmulatedDevice(card=CARD))
+    configure_device(msr, mode="write")
+    msr.invalidate_config()
+    started = time.monotonic()
+    configure_device(msr, mode="write")
+    assert time.monotonic() - started < 0.04  # Not the 50 ms drain kept for after a reset
+
+def test_batch_missing_reply_does_not_shift_the_others():
+    device = EmulatedDevice(card=CARD)
+    msr = _connected(device)
+    handle = device.handle
+    device.handle = lambda message: None if message[1:2] == b"o" else handle(message)
+    statuses = configure_device(msr, mode="write", coercivity="low")
+    replies = _replies(statuses)
+    assert replies["BPC Set"] is None
+    assert replies["Track 1 BPI"] == replies["Track 2 BPI"] == replies["Track 3 BPI"] == ESC + b"0"
+    assert msr.bpc is None
+    assert msr.bpi == [0xA1, 0xD2, 0xC1]
+    assert msr.coercivity == "low"
+
+def test_batch_skips_unexpected_reply():
+    device = EmulatedDevice(card=CARD)
+    msr = _connected(device)
+    handle = device.handle
+
+    def stray(message):
+        handle(message)
+        if message[1:2] == b"o":
+            device.reply(ESC + b"s" + ESC + b"\x01?\x1c" + ESC + b"0")  # A read response
+    device.handle = stray
+    statuses = configure_device(msr, mode="write")
+    assert all(status.ok for status in statuses)
+    assert msr.bpi == [0xA1, 0xD2, 0xC1]
+
+
+def _assert_cache_matches(msr, device):
+    """Every setting msr has cached (None: unknown) is what the device holds."""
+    assert msr.bpc is None or bytes(msr.bpc) == device.bpc
+    assert all(cached in (None, actual) for cached, actual in zip(msr.bpi, device.bpi))
+    assert msr.coercivity in (None, {b"H": "hi", b"L": "low"}[device.coercivity])
+
+@pytest.mark.parametrize("mode, coercivity", [("read", "hi"), ("write", "low"), ("read", "low")])
+def test_configuration_cache_matches_device(mode, coercivity):
+    device = EmulatedDevice(card=CARD)
+    msr = _connected(device)
+    configure_device(msr, mode="write" if mode == "read" else "read")
+    configure_device(msr, mode=mode, coercivity=coercivity)
+    assert msr.bpi == list(BPI_SETTINGS[mode])
+    _assert_cache_matches(msr, device)
+
+def test_reset_keeps_device_settings_and_drops_cache():
+    device = EmulatedDevice(card=CARD)
+    msr = _connected(device)
+    configure_device(msr, mode="read", coercivity="low")
+    msr.reset()
+    assert msr.bpi == [None, None, None]
+    assert device.bpi == [0xA0, 0x4B, 0xC0]
+    assert device.coercivity == b"L"
+
+def test_warm_exclusive_read_sends_only_read_command():
+    device = EmulatedDevice(card=CARD)
+    session = DeviceSession(exclusive=True)
+    session.msr = _connected(device)
+    read_card_data(session)
+    commands = _record_commands(device)
+    assert read_card_data(session)["Track 1"] == "B4111111111111111^DOE/JOHN^2512101"
+    assert commands == [ESC + b"r"]
+    _assert_cache_matches(session.msr, device)
+
+def test_warm_shared_read_repeats_setup():
+    device = EmulatedDevice(card=CARD)
+    session = DeviceSession(exclusive=False)
+    session.msr = _connected(device)
+    read_card_data(session)
+    commands = _record_commands(device)
+    read_card_data(session)
+    assert commands[-1] == ESC + b"r"
+    assert ESC + b"a" in commands  # The setup is sent in full again
+    _assert_cache_matches(session.msr, device)
+
+
+def test_concurrent_reads_share_one_swipe():
+    device = EmulatedDevice(card=CARD, swipe_delay=None)  # Swiped by the test
+    session = _session(device)
+    commands = _record_commands(device)
+    start = threading.Barrier(8)
+    results = []
+
+    def read():
+        start.wait()
+        results.append(read_card_data(session))
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while device._armed is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)  # Let the other readers join the armed read
+    assert device.swipe()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert commands.count(ESC + b"r") == 1
+    assert device.swipes == 1
+    assert len(results) == 8
+    assert all(result == results[0] for result in results)
+    assert results[0]["Track 2"] == "4111111111111111=2512101"
+
+def test_read_after_shared_read_arms_again():
+    device = EmulatedDevice(card=CARD)
+    session = _session(device)
+    commands = _record_commands(device)
+    read_card_data(session)
+    read_card_data(session)
+    assert commands.count(ESC + b"r") == 2
+
+
+def _swipe_response(card):
+    device = EmulatedDevice(card=card)
+    msr = MSR605X(dev=device)
+    msr.connect()
+    msr.send_message(ESC + b"r")
+    return msr.recv_message(timeout=1000)
+
+def test_parse_response_empty_track_2():
+    record = parse_response(_swipe_response((CARD[0], b"", CARD[2])))
+    assert record.track1 == "B4111111111111111^DOE/JOHN^2512101"
+    assert record.track2 == ""
+    assert record.track3 == "0112345678901234"
+    assert record.status == 0x30
+
+def test_parse_response_separator_in_track_3():
+    record = parse_response(_swipe_response((CARD[0], CARD[1], b";011234567890123445=7247241?")))
+    assert record.track2 == "4111111111111111=2512101"
+    assert record.track3 == "011234567890123445=7247241"
+    assert record.status == 0x30
+
+def test_parse_response_without_status_trailer():
+    record = parse_response(ESC + b"s" + ESC + b"\x01%ABC?" + ESC + b"\x02" + ESC + b"\x03")
+    assert (record.track1, record.track2, record.track3, record.status) == ("ABC", "", "", None)
+
+
+def test_write_timeout_disarms_reader():
+    device = EmulatedDevice(card=CARD, swipe_delay=None)  # Nobody swipes
+    msr = _connected(device)
+    result = write_card(msr, b"%NEW?", b";1?", b";2?", timeout=0.2)
+    assert result.timed_out
+    assert not device.swipe()  # A late swipe finds nothing armed...
+    assert device.card == CARD  # ...and writes nothing
+    device.swipe_delay = 0.0
+    assert parse_response(msr.read_tracks()).track2 == "4111111111111111=2512101"
+
+def test_erase_timeout_disarms_reader():
+    device = EmulatedDevice(card=CARD, swipe_delay=None)
+    msr = _connected(device)
+    assert erase_card(msr, 0x07, timeout=0.2) is None
+    assert not device.swipe()
+    assert device.card == CARD
+    device.swipe_delay = 0.0
+    assert parse_response(msr.read_tracks()).track1 == "B4111111111111111^DOE/JOHN^2512101"
+
+
+def _swipe_when_armed(device, card=None, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not device.swipe(card) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def _verify_in_background(msr, tracks, timeout):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(write_and_verify(msr, *tracks, timeout=timeout)))
+    thread.start()
+    return thread, results
+
+def test_verify_reports_mismatching_track():
+    device = EmulatedDevice(card=CARD, swipe_delay=None)
+    msr = _connected(device)
+    thread, results = _verify_in_background(msr, CARD, timeout=5)
+    _swipe_when_armed(device)  # The write
+    _swipe_when_armed(device, card=CARD[:2] + (b";999?",))  # Another card for the read-back
+    thread.join(timeout=5)
+    verify = results[0]
+    assert verify.success and not verify.verified
+    assert verify.mismatches == ["Track 3: wrote '0112345678901234', read '999'"]
+    assert verify.describe() == verify.mismatches[0]
+
+def test_verify_without_second_swipe():
+    device = EmulatedDevice(card=CARD, swipe_delay=None)
+    msr = _connected(device)
+    thread, results = _verify_in_background(msr, CARD, timeout=0.3)
+    _swipe_when_armed(device)
+    thread.join(timeout=5)
+    verify = results[0]
+    assert verify.success and not verify.verified
+    assert verify.record is None
+    assert verify.describe() == "No card swiped for verification"
+    assert not device.swipe()  # The read-back was disarmed
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for the emulated reader itself (msr605x_emulator.py), driven through
+MSR605X the way the services use it.
+
+Run with: python -m pytest client_service
+"""
+
+import pytest
+import usb.core
+
+import msr605x_emulator
+from msr605x import ESC, MSR605X, write_card
+from msr605x_emulator import FIRMWARE, EmulatedDevice, devices_from_environment, parse_error_rates
+
+CARD = (b"%B4111111111111111^DOE/JOHN^2512101?", b";4111111111111111=2512101?", b";0112345678901234?")
+
+
+def _connected(device):
+    msr = MSR605X(dev=device)
+    msr.connect()
+    return msr
+
+
+def test_firmware_version():
+    assert _connected(EmulatedDevice()).get_firmware_version() == FIRMWARE
+
+def test_written_card_reads_back():
+    device = EmulatedDevice()
+    msr = _connected(device)
+    assert write_card(msr, *CARD, timeout=1).success
+    assert device.card == CARD
+    response = msr.read_tracks()
+    assert response.startswith(ESC + b"s" + ESC + b"\x01" + CARD[0])
+    assert response.endswith(b"\x1c" + ESC + b"0")
+
+def test_long_reply_spans_several_packets():
+    card = (b"%" + b"A" * 76 + b"?", b";" + b"1" * 37 + b"?", b";" + b"2" * 104 + b"?")
+    msr = _connected(EmulatedDevice(card=card))
+    response = msr.read_tracks()
+    assert len(response) > 2 * 63
+    assert card[2] in response
+
+def test_manual_swipe_completes_armed_command():
+    device = EmulatedDevice(swipe_delay=None)
+    msr = _connected(device)
+    assert not device.swipe()  # Nothing armed yet
+    msr.send_message(ESC + b"r")
+    assert msr.recv_message(timeout=50) is None
+    assert device.swipe(card=CARD)
+    assert CARD[1] in msr.recv_message(timeout=1000)
+    assert device.swipes == 1
+
+def test_reset_cancels_armed_command():
+    device = EmulatedDevice(swipe_delay=None)
+    msr = _connected(device)
+    msr.send_message(ESC + b"r")
+    msr.reset()
+    assert not device.swipe()
+    assert msr.recv_message(timeout=50) is None
+
+def test_injected_errors():
+    device = EmulatedDevice()
+    msr = _connected(device)
+    device.inject("send", 19)
+    with pytest.raises(usb.core.USBError) as error:
+        msr.send_message(ESC + b"v")
+    assert error.value.errno == 19
+    device.inject("recv", 110)
+    msr.send_message(ESC + b"v")
+    assert msr.recv_message(timeout=100) is None  # Timeouts read as "no reply"
+    assert msr.recv_message(timeout=100) == ESC + FIRMWARE
+    with pytest.raises(ValueError):
+        device.inject("erase", 5)
+
+def test_error_rates_from_spec():
+    assert parse_error_rates("recv:110:0.01, configure:16:0.5") == {"recv": [(110, 0.01)], "configure": [(16, 0.5)]}
+    assert parse_error_rates("") == {}
+    with pytest.raises(ValueError):
+        parse_error_rates("swipe:110:0.1")
+
+def test_devices_from_environment(monkeypatch):
+    monkeypatch.setenv("MSR605X_EMULATOR_DEVICES", "2")
+    monkeypatch.setenv("MSR605X_EMULATOR_SWIPE_DELAY", "manual")
+    monkeypatch.setenv("MSR605X_EMULATOR_ERRORS", "recv:110:0.5")
+    devices = devices_from_environment()
+    assert [device.port_numbers for device in devices] == [(1,), (2,)]
+    assert len({device.address for device in devices}) == 2
+    assert all(device.swipe_delay is None for device in devices)
+    assert devices[0].error_rates == {"recv": [(110, 0.5)]}
+
+def test_find(monkeypatch):
+    devices = [EmulatedDevice(port_numbers=(1,)), EmulatedDevice(port_numbers=(2,))]
+    monkeypatch.setattr(msr605x_emulator, "_devices", devices)
+    assert msr605x_emulator.find(idVendor=0x0801, idProduct=0x0003) is devices[0]
+    assert list(msr605x_emulator.find(find_all=True)) == devices
+    assert msr605x_emulator.find(idVendor=0x1234) is None
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for raw_codec.py and the raw mode commands (ESC m, ESC n) against the
+emulated reader. Skipped when NumPy is not installed.
+
+Run with: python -m pytest client_service
+"""
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from msr605x import ESC, MSR605X, TrackDataError, read_raw_tracks, write_raw_card  # noqa: E402
+from msr605x_emulator import EmulatedDevice  # noqa: E402
+from raw_codec import decode_tracks, encode_tracks  # noqa: E402
+
+CARD = (b"%B4111111111111111^DOE/JOHN^2512101?", b";4111111111111111=2512101?", b";011234567890123445=724724100000?")
+
+
+@pytest.mark.parametrize("track, value", [(1, CARD[0]), (2, CARD[1]), (3, CARD[2])])
+def test_round_trip(track, value):
+    value = value.decode("ascii")
+    raw = encode_tracks([value, ""], track=track, leading_zeros=12)
+    assert raw[1] == b""
+    decoded = decode_tracks(raw, track=track, bitorder="little")
+    assert decoded[0].value == value
+    assert decoded[0].ok
+    assert not decoded[1].ok
+
+def test_manual_example():
+    # Track 1 example of the addendum to the programmer's manual
+    assert encode_tracks(["%ABC123?"], track=1) == [bytes.fromhex("c5b07814954e3e2a")]
+
+def test_sentinels_are_added():
+    raw = encode_tracks(["4111=2512"], track=2)
+    assert decode_tracks(raw, track=2, bitorder="little")[0].value == ";4111=2512?"
+
+def test_parity_error_is_reported():
+    raw = bytearray(encode_tracks([";4111=2512?"], track=2, leading_zeros=8)[0])
+    raw[2] ^= 0x01  # Flip one data bit of the second character
+    decoded = decode_tracks([bytes(raw)], track=2, bitorder="little")[0]
+    assert decoded.parity_errors
+    assert not decoded.ok
+
+def test_invalid_character_is_rejected():
+    with pytest.raises(TrackDataError):
+        encode_tracks([";41a1?"], track=2)
+
+def test_raw_write_and_read_through_emulator():
+    device = EmulatedDevice(card=(b"", b"", b""))
+    msr = MSR605X(dev=device)
+    msr.connect()
+    raws = [encode_tracks([value.decode("ascii")], track=track)[0] for track, value in enumerate(CARD, start=1)]
+    assert write_raw_card(msr, *raws, timeout=1).success
+    assert device.card == CARD
+    record = read_raw_tracks(msr, timeout=1000)
+    assert record.ok
+    for track, raw in enumerate(record[:3], start=1):
+        assert decode_tracks([raw], track=track)[0].value == CARD[track - 1].decode("ascii")
+
+def test_raw_read_keeps_escape_bytes_in_data():
+    device = EmulatedDevice(card=(b"%QC?", b"", b""))  # Encodes to a3 1b 17 c1 00
+    msr = MSR605X(dev=device)
+    msr.connect()
+    record = read_raw_tracks(msr, timeout=1000)
+    assert ESC in record.track1
+    assert record.track2 == b"" and record.track3 == b""
+    decoded = decode_tracks([record.track1], track=1)[0]
+    assert decoded.value == "%QC?"
+    assert decoded.ok
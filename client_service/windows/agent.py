@@ -12,11 +12,18 @@ import base64
 import json
 import logging
 import threading
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from websocket import create_connection, WebSocketBadStatusException, WebSocketConnectionClosedException
 
+from metrics import timed, render, CONTENT_TYPE
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s %(message)s",
@@ -29,6 +36,9 @@ if not AGENT_TOKEN:
     # try rails env: SetEnv AGENT_TOKEN in apache vhost
     log.error("AGENT_TOKEN not set in environment. Set AGENT_TOKEN before starting.")
     # allow continuing for debug but will fail to subscribe
+# "http": forward to the local Flask services; "local": call the msr605x library
+# in this process (falls back to http if the library or reader is unavailable)
+AGENT_DISPATCH = os.environ.get("AGENT_DISPATCH", "http")
 READ_URL = os.environ.get("READ_URL", "http://127.0.0.1:5000/read")
 WRITE_URL = os.environ.get("WRITE_URL", "http://127.0.0.1:5001/write")
 WS_HOST = os.environ.get("ACTION_CABLE_HOST", "app.mustbetan.com")
@@ -37,13 +47,132 @@ WS_URL = os.environ.get("ACTION_CABLE_URL", f"wss://{WS_HOST}/cable")
 # timeout settings
 LOCAL_TIMEOUT = int(os.environ.get("LOCAL_TIMEOUT", "8"))
 RESP_TIMEOUT = int(os.environ.get("RESP_TIMEOUT", "20"))  # how long to wait local service
+CONNECT_TIMEOUT = float(os.environ.get("CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT = float(os.environ.get("READ_TIMEOUT", LOCAL_TIMEOUT))    # /read waits for a swipe
+WRITE_TIMEOUT = float(os.environ.get("WRITE_TIMEOUT", LOCAL_TIMEOUT))  # /write waits for a swipe
+
+# keep-alive pool for the local services (one TCP/TLS connection reused per worker)
+LOCAL_POOL_SIZE = int(os.environ.get("LOCAL_POOL_SIZE", os.environ.get("AGENT_WORKERS", "4")))
+LOCAL_RETRIES = int(os.environ.get("LOCAL_RETRIES", "2"))  # connect failures only
+
+# local /metrics endpoint with the agent's stage latencies (0 disables it)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9605"))
+
+# worker pool: requests run here so the ws.recv() loop keeps answering pings
+AGENT_WORKERS = int(os.environ.get("AGENT_WORKERS", "4"))
+DEFAULT_DEVICE = "default"  # requests without a "device" field all go to the one local reader
+
+executor = ThreadPoolExecutor(max_workers=AGENT_WORKERS, thread_name_prefix="agent-worker")
+
+# one lock per device, so requests for the same reader run one at a time
+_device_locks = {}
+_device_locks_guard = threading.Lock()
+
+def device_lock(device):
+    with _device_locks_guard:
+        lock = _device_locks.get(device)
+        if lock is None:
+            lock = _device_locks[device] = threading.Lock()
+        return lock
+
+class CableConnection:
+    """
+    The current websocket, shared by the receive loop and the workers.
+    Sends are serialized (websocket-client is not safe for concurrent sends)
+    and always go to the live socket, so a request that finishes after a
+    reconnect still gets its response out.
+    """
+    def __init__(self):
+        self.ws = None
+        self.lock = threading.Lock()
+
+    def send(self, text):
+        with self.lock:
+            if self.ws is None:
+                raise WebSocketConnectionClosedException("websocket not connected")
+            self.ws.send(text)
+
+connection = CableConnection()
+
+# how long a finished response is kept for re-broadcasts of the same request id
+REQUEST_CACHE_TTL = float(os.environ.get("REQUEST_CACHE_TTL", "300"))
+
+class RequestCache:
+    """
+    Responses by broadcast request id, so a request that is broadcast again
+    (or re-delivered after a reconnect) never runs a second device operation.
+    In-flight entries stay until the request finishes; finished ones expire
+    after ttl seconds.
+    """
+    def __init__(self, ttl=REQUEST_CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}       # id -> Future with the response payload
+        self.expiry = deque()   # (expires_at, id) in completion order
+
+    def _purge(self, now):
+        while self.expiry and self.expiry[0][0] <= now:
+            _, req_id = self.expiry.popleft()
+            self.entries.pop(req_id, None)
+
+    def claim(self, req_id):
+        """Return (future, True) for a new id, or (existing future, False) for a duplicate."""
+        with self.lock:
+            self._purge(time.monotonic())
+            future = self.entries.get(req_id)
+            if future is not None:
+                return future, False
+            future = self.entries[req_id] = Future()
+            return future, True
+
+    def complete(self, req_id, response_payload):
+        with self.lock:
+            future = self.entries.get(req_id)
+            self.expiry.append((time.monotonic() + self.ttl, req_id))
+        if future is not None:
+            future.set_result(response_payload)
+
+request_cache = RequestCache()
+
+def make_local_session():
+    """
+    requests.Session with a keep-alive pool for the local services. Only
+    connection failures are retried: the request never reached the service,
+    so no swipe was asked for. A read timeout is never retried, since the
+    reader may already be armed.
+    """
+    retry = Retry(total=LOCAL_RETRIES, connect=LOCAL_RETRIES, read=0, status=0, other=0,
+                  backoff_factor=0.2, allowed_methods=frozenset(["GET"]))
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=LOCAL_POOL_SIZE, pool_block=False, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+local_session = make_local_session()
+
+def log_pool_stats(url):
+    # num_connections counts new TCP connections, num_requests every request on the pool
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    pools = local_session.get_adapter(url).poolmanager.pools
+    requests_made = connections = 0
+    for key in pools.keys():
+        pool = pools[key]
+        if pool.host == parsed.hostname and pool.port == port:
+            requests_made += pool.num_requests
+            connections += pool.num_connections
+    log.info("local pool %s:%d: %d request(s) on %d connection(s), %d reused",
+             parsed.hostname, port, requests_made, connections, max(requests_made - connections, 0))
 
 # helper: perform local request (GET/POST)
+@timed("agent.local_request")
 def do_local_request(method, path, headers=None, body_b64=None):
     headers = headers or {}
     try:
         if method == "GET":
-            r = requests.get(READ_URL, headers=headers, timeout=LOCAL_TIMEOUT)
+            r = local_session.get(READ_URL, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            log_pool_stats(READ_URL)
         else:  # POST
             data = b""
             if body_b64:
@@ -52,7 +181,8 @@ def do_local_request(method, path, headers=None, body_b64=None):
                 except Exception:
                     data = body_b64.encode("utf-8")
             # forward content-type if present
-            r = requests.post(WRITE_URL, headers=headers, data=data, timeout=LOCAL_TIMEOUT)
+            r = local_session.post(WRITE_URL, headers=headers, data=data, timeout=(CONNECT_TIMEOUT, WRITE_TIMEOUT))
+            log_pool_stats(WRITE_URL)
         return {
             "status": r.status_code,
             "headers": dict(r.headers),
@@ -62,6 +192,83 @@ def do_local_request(method, path, headers=None, body_b64=None):
         log.exception("Local call failed")
         return {"status": 500, "headers": {}, "body": base64.b64encode(str(e).encode()).decode("ascii")}
 
+# in-process dispatch: same status/headers/body shape as the Flask services
+_local_session = None
+_local_session_guard = threading.Lock()
+
+def get_local_session():
+    """DeviceSession for in-process requests, created on first use."""
+    global _local_session
+    with _local_session_guard:
+        if _local_session is None:
+            from msr605x import DeviceSession
+            from device_registry import DeviceRegistry
+            # Shared by default, like the services: every request then repeats
+            # the BPC/BPI setup (reads also ESC a and a 0.5 s wait).
+            exclusive = os.environ.get("MSR605X_EXCLUSIVE") == "1"
+            _local_session = DeviceSession(exclusive=exclusive, registry=DeviceRegistry().watch())
+        return _local_session
+
+def json_response(status, obj):
+    # same bytes as Flask's jsonify (sorted keys, compact, trailing newline)
+    body = (json.dumps(obj, sort_keys=True, separators=(",", ":")) + "\n").encode("utf-8")
+    return {
+        "status": status,
+        "headers": {"Content-Type": "application/json", "Content-Length": str(len(body))},
+        "body": base64.b64encode(body).decode("ascii")
+    }
+
+@timed("agent.inprocess_request")
+def do_inprocess_request(method, path, body_b64=None):
+    """
+    Run the request on the reader directly (what read_service/write_service do).
+    Returns None if the library or the reader is unavailable, so the caller
+    can fall back to HTTP.
+    """
+    try:
+        from msr605x import read_card_data, write_card_data, DeviceNotFoundError, TrackDataError
+        session = get_local_session()
+    except (ImportError, OSError):
+        log.exception("In-process dispatch unavailable")
+        return None
+    try:
+        if method == "GET":
+            return json_response(200, read_card_data(session))
+        data = json.loads(base64.b64decode(body_b64) or b"{}") if body_b64 else {}
+        track1 = data.get("track1", "")
+        track2 = data.get("track2", "")
+        track3 = data.get("track3", "")
+        coercivity = data.get("coercivity", "hi")
+        verify = bool(data.get("verify", False))
+        if not (track1 and track2 and track3):
+            return json_response(400, {"error": "Missing track data; please supply track1, track2, and track3."})
+        try:
+            result = write_card_data(track1.encode(), track2.encode(), track3.encode(), coercivity, session=session, verify=verify)
+        except TrackDataError as e:
+            return json_response(400, {"error": str(e), "problems": e.problems})
+        if not result.success:
+            write_result = result.write if verify else result
+            return json_response(500, {"error": f"Write failed: {result.describe()}", "status": write_result.status})
+        if verify and not result.verified:
+            return json_response(500, {"error": f"Verification failed: {result.describe()}", "mismatches": result.mismatches})
+        if verify:
+            return json_response(200, {"message": "Write action completed", "track3": track3, "verified": True})
+        return json_response(200, {"message": "Write action completed", "track3": track3})
+    except DeviceNotFoundError as e:
+        log.warning("Reader not available in-process (%s); using HTTP", e)
+        return None
+    except Exception as e:
+        log.exception("In-process call failed")
+        return json_response(500, {"error": str(e)})
+
+def dispatch_request(method, path, headers=None, body_b64=None):
+    """Run a proxied request in-process or over HTTP, depending on AGENT_DISPATCH."""
+    if AGENT_DISPATCH == "local":
+        resp = do_inprocess_request(method, path, body_b64=body_b64)
+        if resp is not None:
+            return resp
+    return do_local_request(method, path, headers=headers, body_b64=body_b64)
+
 # build actioncable identifier JSON string
 def make_identifier():
     # subscribe to LocalAgentChannel with agent_token (server expects this)
@@ -105,6 +312,36 @@ def send_response_action(ws, identifier, response_data):
     except Exception:
         log.exception("Failed sending response action")
 
+@timed("agent.request")
+def process_request(ws, identifier, message):
+    """Run one proxied request on a worker thread and send its response."""
+    req_id = message.get("id")
+    method = message.get("method", "GET")
+    path = message.get("path", "")
+    headers = message.get("headers", {})
+    body_b64 = message.get("body", "")  # already base64 (for write) or empty
+    device = message.get("device") or DEFAULT_DEVICE
+
+    # perform local call and build response, one request per device at a time
+    try:
+        with device_lock(device):
+            resp = dispatch_request(method, path, headers=headers, body_b64=body_b64)
+    except Exception as e:
+        # duplicates are waiting on this request, so it must always produce a response
+        log.exception("Request id=%s failed", req_id)
+        resp = {"status": 500, "headers": {}, "body": base64.b64encode(str(e).encode()).decode("ascii")}
+    response_payload = {
+        "id": req_id,
+        "status": resp.get("status", 500),
+        "headers": resp.get("headers", {}),
+        "body": resp.get("body", "")
+    }
+    if req_id is not None:
+        request_cache.complete(req_id, response_payload)
+    # send perform('response', response_payload)
+    send_response_action(ws, identifier, response_payload)
+
+@timed("agent.handle_message")
 def handle_message(ws, msg_text, identifier):
     """
     Incoming messages from server. ActionCable messages typically are JSON:
@@ -125,23 +362,19 @@ def handle_message(ws, msg_text, identifier):
         message = msg["message"]
         # Our controller broadcasts payload like { type: "request", id:..., method:..., path:..., headers:..., body:... }
         if isinstance(message, dict) and message.get("type") == "request":
+            log.info("[local_proxy] received request id=%s method=%s path=%s",
+                     message.get("id"), message.get("method", "GET"), message.get("path", ""))
             req_id = message.get("id")
-            method = message.get("method", "GET")
-            path = message.get("path", "")
-            headers = message.get("headers", {})
-            body_b64 = message.get("body", "")  # already base64 (for write) or empty
-            log.info("[local_proxy] received request id=%s method=%s path=%s", req_id, method, path)
-
-            # perform local call and build response
-            resp = do_local_request(method, path, headers=headers, body_b64=body_b64)
-            response_payload = {
-                "id": req_id,
-                "status": resp.get("status", 500),
-                "headers": resp.get("headers", {}),
-                "body": resp.get("body", "")
-            }
-            # send perform('response', response_payload)
-            send_response_action(ws, identifier, response_payload)
+            if req_id is not None:
+                future, is_new = request_cache.claim(req_id)
+                if not is_new:
+                    # same id again: answer from the first run instead of asking for another swipe
+                    state = "finished" if future.done() else "in flight"
+                    log.info("[local_proxy] duplicate request id=%s (%s); reusing its response", req_id, state)
+                    future.add_done_callback(lambda f: send_response_action(ws, identifier, f.result()))
+                    return
+            # hand off to the pool; a read waiting for a swipe must not block recv()
+            executor.submit(process_request, ws, identifier, message)
         else:
             log.debug("Message not a request: %s", message)
     elif msg.get("type") == "welcome":
@@ -153,6 +386,28 @@ def handle_message(ws, msg_text, identifier):
     else:
         log.debug("Unhandled ws message: %s", msg)
 
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("metrics: " + format, *args)
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on localhost in a background thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="agent-metrics", daemon=True).start()
+    log.info("Metrics on http://127.0.0.1:%d/metrics", port)
+    return server
+
 def run_loop():
     identifier = make_identifier()
     headers = make_ws_headers()
@@ -169,7 +424,8 @@ def run_loop():
             log.info("Connecting to %s (Host header: %s)", WS_URL, headers[0].split(": ", 1)[1])
             ws = create_connection(WS_URL, header=headers, sslopt=sslopt, timeout=20)
             log.info("WebSocket connected. Sending subscribe.")
-            send_subscribe(ws, identifier)
+            connection.ws = ws
+            send_subscribe(connection, identifier)
 
             # read loop
             backoff = 1.0
@@ -180,13 +436,16 @@ def run_loop():
                         log.warning("ws.recv() returned None. Connection probably closed.")
                         break
                     # handle incoming message
-                    handle_message(ws, msg, identifier)
+                    handle_message(connection, msg, identifier)
                 except WebSocketConnectionClosedException:
                     log.warning("Websocket closed by server.")
                     break
                 except Exception:
                     log.exception("Error while waiting on ws.recv()")
                     break
+            with connection.lock:
+                connection.ws = None
+            ws.close()
 
         except WebSocketBadStatusException as e:
             # this is the 400/404/xxx from server on handshake
@@ -199,5 +458,7 @@ def run_loop():
         backoff = min(backoff * 2, 60.0)
 
 if __name__ == "__main__":
-    log.info("Starting agent (token-only). READ=%s WRITE=%s AGENT_TOKEN(len)=%s", READ_URL, WRITE_URL, len(AGENT_TOKEN) if AGENT_TOKEN else 0)
+    log.info("Starting agent (token-only). DISPATCH=%s READ=%s WRITE=%s AGENT_TOKEN(len)=%s", AGENT_DISPATCH, READ_URL, WRITE_URL, len(AGENT_TOKEN) if AGENT_TOKEN else 0)
+    if METRICS_PORT:
+        start_metrics_server()
     run_loop()
\ No newline at end of file
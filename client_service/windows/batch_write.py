@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Batch writer for card personalization runs.
+
+Reads track1/track2/track3 records from a JSONL or CSV file (CSV needs a
+header row with those column names), configures the MSR605X once and then
+writes one record per swipe. Every record is validated against the track
+character sets and capacities first; invalid records are reported and skipped
+without asking for a swipe. Progress is checkpointed after every card to
+<input>.checkpoint, so starting the same command again after a crash or
+Ctrl+C resumes with the first card that was not written yet. Cards the device
+keeps rejecting are appended to <input>.failed.jsonl and skipped.
+
+At the end it reports per-card latency (command sent to write status, summed
+over the retries of the card) and the throughput in swiped cards per minute;
+records skipped as invalid count in neither.
+
+Usage:
+  python batch_write.py cards.jsonl
+  python batch_write.py cards.csv --coercivity low --retries 1
+  python batch_write.py cards.jsonl --restart   # ignore the checkpoint
+"""
+
+import os
+import csv
+import json
+import time
+import argparse
+
+from msr605x import MSR605X, configure_device, write_card, finalize_device, validate_batch
+
+TRACK_FIELDS = ("track1", "track2", "track3")
+
+def load_records(path, fmt=None):
+    """Load the track records of a JSONL or CSV file as a list of dicts."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    records = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows, start=1):
+            missing = [field for field in TRACK_FIELDS if field not in row]
+            if missing:
+                raise ValueError(f"Record {number} is missing {', '.join(missing)}")
+            records.append({field: row[field] or "" for field in TRACK_FIELDS})
+    return records
+
+def load_checkpoint(path):
+    """Return the saved progress, or a fresh one if there is no checkpoint."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"next": 0, "written": 0, "failed": 0}
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically so a crash never leaves it half-written."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def write_record(msr, record, coercivity, swipe_timeout, retries):
+    """
+    Write one record, re-arming after a timeout (no swipe yet) and retrying
+    device errors up to retries times. Returns (WriteResult, latency), the
+    latency being the time spent writing the card over all its attempts.
+    """
+    track1, track2, track3 = (record[field].encode() for field in TRACK_FIELDS)
+    latency = 0.0
+    attempts = 0
+    while True:
+        # No-op unless a timeout reset the device since the last card.
+        configure_device(msr, mode="write", coercivity=coercivity)
+        result = write_card(msr, track1, track2, track3, timeout=swipe_timeout)
+        if result.timed_out:
+            print(f"No swipe within {swipe_timeout:.0f} s; still waiting for this card...", flush=True)
+            continue
+        latency += result.elapsed
+        if result.success or attempts >= retries:
+            return result, latency
+        attempts += 1
+        print(f"Retrying card ({attempts}/{retries})...", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a batch of cards with the MSR605X")
+    parser.add_argument("input", help="JSONL or CSV file with track1, track2 and track3 per record")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None, help="Input format (default: from the file extension)")
+    parser.add_argument("--coercivity", choices=["hi", "low"], default="hi", help="Coercivity mode to use (hi or low)")
+    parser.add_argument("--retries", type=int, default=2, help="Extra swipes allowed when the device reports a write error")
+    parser.add_argument("--swipe-timeout", type=float, default=10, help="Seconds to wait for each swipe before re-arming")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first record")
+    args = parser.parse_args()
+
+    records = load_records(args.input, args.format)
+    checkpoint_path = args.input + ".checkpoint"
+    failed_path = args.input + ".failed.jsonl"
+    checkpoint = {"next": 0, "written": 0, "failed": 0} if args.restart else load_checkpoint(checkpoint_path)
+    start_index = checkpoint["next"]
+    if start_index >= len(records):
+        print(f"All {len(records)} records already written (delete {checkpoint_path} or use --restart to run again).")
+        return
+    if start_index:
+        print(f"Resuming at record {start_index + 1} of {len(records)}.")
+
+    invalid = dict(validate_batch(tuple(record[field] for field in TRACK_FIELDS) for record in records))
+    skipped = sum(1 for index in invalid if index >= start_index)
+    if skipped:
+        print(f"{skipped} record(s) have invalid track data and will be skipped.")
+
+    msr = MSR605X()
+    msr.connect()
+    msr.reset()
+    print("MSR605X connected and ready.")
+
+    latencies = []  # One per swiped card
+    written = failed = 0
+    started = time.monotonic()
+    try:
+        for index in range(start_index, len(records)):
+            if index in invalid:
+                # Never spend a swipe on a record the device would reject.
+                print(f"\nCard {index + 1} of {len(records)}: skipped, {'; '.join(invalid[index])}", flush=True)
+                success = False
+                failure = {"status": "invalid track data", "problems": invalid[index]}
+            else:
+                print(f"\nCard {index + 1} of {len(records)}: swipe the card...", flush=True)
+                result, latency = write_record(msr, records[index], args.coercivity, args.swipe_timeout, args.retries)
+                latencies.append(latency)
+                success = result.success
+                failure = {"status": result.describe()}
+            if success:
+                written += 1
+                checkpoint["written"] += 1
+            else:
+                failed += 1
+                checkpoint["failed"] += 1
+                with open(failed_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"index": index, **failure, **records[index]}) + "\n")
+            checkpoint["next"] = index + 1
+            save_checkpoint(checkpoint_path, checkpoint)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; progress saved to {checkpoint_path}.")
+    finally:
+        finalize_device(msr)
+
+    elapsed = time.monotonic() - started
+    print(f"\nWrote {written} card(s), {failed} failed, in {elapsed:.1f} s.")
+    if latencies:
+        print(f"Per-card latency: avg {sum(latencies) / len(latencies):.2f} s, "
+              f"p50 {percentile(latencies, 0.5):.2f} s, p95 {percentile(latencies, 0.95):.2f} s, "
+              f"max {max(latencies):.2f} s")
+    if elapsed > 0 and latencies:
+        print(f"Throughput: {len(latencies) / elapsed * 60:.1f} cards/minute")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Cache of attached MSR605X readers.
+
+usb.core.find() enumerates the whole bus every time it is called, which is
+slow on hosts with busy hubs. DeviceRegistry scans once, keeps the device
+handles keyed by device_key() and only scans again when the set of readers
+changes:
+
+  - with pyudev installed, on udev add/remove events for a matching device;
+  - otherwise on Linux, when polling /sys/bus/usb/devices shows a change
+    (a directory listing and a few small file reads, no USB traffic);
+  - otherwise (e.g. on Windows), when a lookup misses or a caller reports a
+    stale handle with invalidate().
+
+Handles are resolved with get(), which is a dictionary lookup once the cache
+is warm:
+
+    registry = DeviceRegistry().watch()
+    msr = MSR605X(dev=registry.get())
+"""
+
+import os
+import threading
+
+from msr605x import DeviceNotFoundError, find_devices, device_key
+
+SYSFS_USB_DEVICES = "/sys/bus/usb/devices"
+
+# Seconds between sysfs polls when pyudev is not installed.
+POLL_INTERVAL = 1.0
+
+class DeviceRegistry:
+    """
+    Keeps the handles of the attached readers. find_kwargs narrow the scan
+    (see find_devices).
+    """
+    def __init__(self, **find_kwargs):
+        self.find_kwargs = find_kwargs
+        self.vendor_id = find_kwargs.get("idVendor", 0x0801)
+        self.product_id = find_kwargs.get("idProduct", 0x0003)
+        self.scans = 0
+        self._devices = {}
+        self._scanned = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def refresh(self):
+        """
+        Scan the bus and update the cache. Readers that are still on the same
+        port with the same address keep their cached handle.
+        Returns the keys of the attached readers.
+        """
+        found = {}
+        for dev in find_devices(**self.find_kwargs):
+            key = device_key(dev)
+            cached = self._devices.get(key)
+            found[key] = cached if cached is not None and cached.address == dev.address else dev
+        with self._lock:
+            self._devices = found
+            self._scanned = True
+            self.scans += 1
+        return list(found)
+
+    def devices(self):
+        """Return {key: usb.core.Device} for the attached readers."""
+        if not self._scanned:
+            self.refresh()
+        with self._lock:
+            return dict(self._devices)
+
+    def _lookup(self, key):
+        with self._lock:
+            if key is None:
+                return next(iter(self._devices.values()), None)
+            return self._devices.get(key)
+
+    def get(self, key=None):
+        """
+        Return the handle of the reader with the given key, or of any reader
+        if key is None. The bus is only scanned if the reader is not cached.
+        """
+        dev = self._lookup(key)
+        if dev is None:
+            self.refresh()
+            dev = self._lookup(key)
+        if dev is None:
+            raise DeviceNotFoundError("Device not found. Check connection.")
+        return dev
+
+    def invalidate(self, key=None):
+        """Drop a stale handle (all handles if key is None); the next get() scans again."""
+        with self._lock:
+            if key is None:
+                self._devices = {}
+            else:
+                self._devices.pop(key, None)
+
+    def watch(self, poll_interval=POLL_INTERVAL):
+        """
+        Keep the cache current in the background: udev events if pyudev is
+        installed, otherwise sysfs polling. Does nothing where neither is
+        available. Returns the registry.
+        """
+        if self._watcher is not None:
+            return self
+        try:
+            import pyudev
+        except ImportError:
+            pyudev = None
+        if pyudev is not None:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by(subsystem="usb", device_type="usb_device")
+            self._watcher = pyudev.MonitorObserver(monitor, callback=self._on_udev_event, name="msr605x-udev")
+            self._watcher.start()
+        elif os.path.isdir(SYSFS_USB_DEVICES):
+            self._watcher = threading.Thread(target=self._poll_sysfs, args=(poll_interval,),
+                                             name="msr605x-sysfs", daemon=True)
+            self._watcher.start()
+        return self
+
+    def stop(self):
+        """Stop watching for hot-plug events."""
+        if self._watcher is None:
+            return
+        self._stop.set()
+        if isinstance(self._watcher, threading.Thread):
+            self._watcher.join()
+        else:
+            self._watcher.stop()
+        self._watcher = None
+        self._stop.clear()
+
+    def _on_udev_event(self, device):
+        # PRODUCT is "<vendor>/<product>/<bcdDevice>" in hex without leading zeros,
+        # and is still present on remove events, unlike the sysfs attributes.
+        if device.action not in ("add", "remove"):
+            return
+        if device.properties.get("PRODUCT", "").startswith(f"{self.vendor_id:x}/{self.product_id:x}/"):
+            self.refresh()
+
+    def _sysfs_snapshot(self):
+        """(entry name, device number) of every matching device in sysfs."""
+        vendor = f"{self.vendor_id:04x}"
+        product = f"{self.product_id:04x}"
+        snapshot = set()
+        try:
+            names = os.listdir(SYSFS_USB_DEVICES)
+        except OSError:
+            return snapshot
+        for name in names:
+            if ":" in name:
+                continue  # Interface entry
+            path = os.path.join(SYSFS_USB_DEVICES, name)
+            try:
+                with open(os.path.join(path, "idVendor")) as f:
+                    if f.read().strip() != vendor:
+                        continue
+                with open(os.path.join(path, "idProduct")) as f:
+                    if f.read().strip() != product:
+                        continue
+                with open(os.path.join(path, "devnum")) as f:
+                    snapshot.add((name, f.read().strip()))
+            except OSError:
+                continue  # Root hub without the attributes, or removed while reading
+        return snapshot
+
+    def _poll_sysfs(self, poll_interval):
+        last = self._sysfs_snapshot()
+        while not self._stop.wait(poll_interval):
+            current = self._sysfs_snapshot()
+            if current != last:
+                self.refresh()
+                last = current
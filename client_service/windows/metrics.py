@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Per-stage latency histograms in the Prometheus text format.
+
+Every stage of a request (agent, HTTP route, device configuration, USB
+transfers, waiting for the swipe) records its duration with timed():
+
+    with timed("device.connect"):
+        ...
+
+    @timed("route.read")
+    def read(): ...
+
+render() returns all histograms for a /metrics endpoint, e.g.
+
+    msr605x_stage_seconds_bucket{stage="device.recv_message",le="0.5"} 12
+    msr605x_stage_seconds_sum{stage="device.recv_message"} 9.71
+    msr605x_stage_seconds_count{stage="device.recv_message"} 14
+
+Counts are per process; scrape each service (and the agent) separately.
+"""
+
+import functools
+import threading
+from time import perf_counter
+from bisect import bisect_left
+
+# Bucket upper bounds in seconds: USB transfers take milliseconds, swipes seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class Histogram:
+    """Cumulative latency histogram with one series per label value."""
+    def __init__(self, name, help_text, label, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self.series = {}  # label value -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def series_for(self, value):
+        """The [bucket counts..., +Inf count, sum] list of one label value."""
+        with self.lock:
+            series = self.series.get(value)
+            if series is None:
+                series = self.series[value] = [0] * (len(self.buckets) + 1) + [0.0]
+            return series
+
+    def observe(self, value, seconds):
+        series = self.series_for(value)
+        index = bisect_left(self.buckets, seconds)
+        with self.lock:
+            series[index] += 1
+            series[-1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {value: list(series) for value, series in self.series.items()}
+        for value in sorted(snapshot):
+            series = snapshot[value]
+            label = f'{self.label}="{value}"'
+            total = 0
+            for bound, count in zip(self.buckets, series):
+                total += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {total}')
+            total += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {total}')
+            lines.append(f"{self.name}_sum{{{label}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {total}")
+        return "\n".join(lines) + "\n"
+
+STAGE_SECONDS = Histogram("msr605x_stage_seconds", "Time spent in each stage of a card operation.", "stage")
+
+def observe(stage, seconds):
+    """Record one duration for a stage."""
+    STAGE_SECONDS.observe(stage, seconds)
+
+class timed:
+    """Context manager and decorator that records the duration of a stage, also when it raises."""
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(self.stage, perf_counter() - self.start)
+
+    def __call__(self, func):
+        # Resolved once here: the wrapper sits on per-message USB calls, so it
+        # only does the clock reads, one bisect and the locked update.
+        series = STAGE_SECONDS.series_for(self.stage)
+        buckets = STAGE_SECONDS.buckets
+        lock = STAGE_SECONDS.lock
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                index = bisect_left(buckets, elapsed)
+                with lock:
+                    series[index] += 1
+                    series[-1] += elapsed
+        return wrapper
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    return STAGE_SECONDS.render()
@@ -4,12 +4,19 @@ WIP library for the MSR605X
 
 This file contains:
   - The MSR605X class with low-level and high-level functions.
-  - Utility functions for BPC/BPI setup, parsing track data, write completion,
-    writing card data, and erasing card data.
+  - A CommandBatch class that sends several commands back-to-back and then
+    collects their ACKs in order.
+  - Utility functions for BPC/BPI setup, parsing and validating track data,
+    write completion, writing card data, and erasing card data.
+  - A DeviceSession class that keeps one device open across requests for
+    the read/write services.
   - A main() function using subparsers:
       * "read" mode: reads card data.
       * "write" mode: writes card data with track data passed as command-line arguments.
       * "erase" mode: erases card data for specified tracks.
+      * "stream" mode: keeps the reader armed and prints every swipe.
+      * "read-raw" / "write-raw" modes: raw bit-level read and write (ESC m / ESC n),
+        decoded and encoded with raw_codec (needs NumPy).
 """
 import os
 import ctypes
@@ -25,7 +32,13 @@ import usb.core
 import usb.util
 import usb.backend.libusb1  # Explicitly import the libusb1 backend
 import time
+import array
 import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+
+from metrics import timed
 
 ESC = b"\x1b"
 FS  = b"\x1c"
@@ -34,23 +47,81 @@ SEQUENCE_START_BIT   = 0b10000000
 SEQUENCE_END_BIT     = 0b01000000
 SEQUENCE_LENGTH_BITS = 0b00111111
 
-class MSR605X:
-    """Represents an MSR605X device."""
-    def __init__(self, **kwargs):
-        if "idVendor" not in kwargs:
-            kwargs["idVendor"] = 0x0801
-            kwargs["idProduct"] = 0x0003
+PACKET_SIZE  = 64
+PAYLOAD_SIZE = PACKET_SIZE - 1
+
+_ZERO_PADDING = memoryview(bytes(PAYLOAD_SIZE))
+
+# BPC for tracks 1, 2 and 3 (ESC o).
+BPC_SETTING = bytes([0x07, 0x05, 0x05])
+
+# BPC for raw reads and writes: every byte carries 8 bits of the stripe.
+RAW_BPC_SETTING = bytes([0x08, 0x08, 0x08])
+
+# BPI selector bytes for tracks 1, 2 and 3 (ESC b).
+BPI_SETTINGS = {
+    "read":  (0xA0, 0x4B, 0xC0),  # 75 BPI on all tracks
+    "write": (0xA1, 0xD2, 0xC1),  # 210 BPI on all tracks
+}
 
-        backend = usb.backend.libusb1.get_backend(find_library=lambda x: dll_path)
+# Coercivity commands and their display names.
+COERCIVITY_COMMANDS = {
+    "hi":  (ESC + b'x', "Hi-Co"),
+    "low": (ESC + b'y', "Low-Co"),
+}
 
-        if backend is None:
-            raise ImportError(f"libusb backend not loaded (dll_path tried: {dll_path})")
+# MSR605X_EMULATOR=1 replaces the USB bus with emulated readers (msr605x_emulator.py).
+EMULATOR = os.environ.get("MSR605X_EMULATOR") == "1"
 
-        self.dev = usb.core.find(backend=backend, **kwargs)
+def _usb_find(**kwargs):
+    """usb.core.find() on the libusb backend, or the emulator's find() if EMULATOR is set."""
+    if EMULATOR:
+        import msr605x_emulator
+        return msr605x_emulator.find(**kwargs)
+    backend = usb.backend.libusb1.get_backend(find_library=lambda x: dll_path)
+    if backend is None:
+        raise ImportError(f"libusb backend not loaded (dll_path tried: {dll_path})")
+    return usb.core.find(backend=backend, **kwargs)
+
+class DeviceNotFoundError(ValueError):
+    """No MSR605X reader is attached (or none matches the requested one)."""
+
+class MSR605X:
+    """
+    Represents an MSR605X device.
+    Pass an already resolved usb.core.Device as dev (e.g. from a DeviceRegistry)
+    to skip the bus scan; otherwise the first device matching kwargs is used.
+    """
+    def __init__(self, dev=None, **kwargs):
+        if dev is None:
+            if "idVendor" not in kwargs:
+                kwargs["idVendor"] = 0x0801
+                kwargs["idProduct"] = 0x0003
+            with timed("device.find"):
+                dev = _usb_find(**kwargs)
+        self.dev = dev
         if self.dev is None:
-            raise ValueError("Device not found. Check connection and driver installation.")
+            raise DeviceNotFoundError("Device not found. Check connection and driver installation.")
         self.hid_endpoint = None
+        self.invalidate_config()
+        # Set when a reply may still arrive for a command the host gave up on
+        # (see reset()); the next CommandBatch then drains with a longer wait.
+        self.reply_pending = False
+        # Packet and reassembly buffers reused for every message. array.array is
+        # what pyusb reads into and sends from without making its own copy.
+        self._tx_packet = array.array('B', bytes(PACKET_SIZE))
+        self._tx_view = memoryview(self._tx_packet)
+        self._rx_packet = array.array('B', bytes(PACKET_SIZE))
+        self._rx_view = memoryview(self._rx_packet)
+        self._rx_message = bytearray()
 
+    def invalidate_config(self):
+        """Forget the cached BPC/BPI/coercivity so the next setup is sent in full."""
+        self.bpc = None
+        self.bpi = [None, None, None]
+        self.coercivity = None
+
+    @timed("device.connect")
     def connect(self):
         """Establish a connection to the MSR605X with retry on 'Resource busy' errors."""
         max_attempts = 3
@@ -77,6 +148,7 @@ class MSR605X:
         config = self.dev.get_active_configuration()
         interface = config[(0, 0)]
         self.hid_endpoint = interface.endpoints()[0]
+        self.invalidate_config()
 
     def _make_header(self, start_of_sequence: bool, end_of_sequence: bool, length: int):
         if length < 0 or length > 63:
@@ -86,23 +158,37 @@ class MSR605X:
             header |= SEQUENCE_START_BIT
         if end_of_sequence:
             header |= SEQUENCE_END_BIT
-        return bytes([header])
+        return header
 
     def _encapsulate_message(self, message):
+        """
+        Yield the 64-byte HID packets for message. Every packet is built in the
+        same preallocated buffer, so each one must be sent before taking the next.
+        """
+        source = memoryview(message)
+        packet = self._tx_view
+        total = len(source)
         idx = 0
-        while idx < len(message):
-            payload = message[idx:idx+63]
-            header = self._make_header(idx == 0, len(message) - idx < 64, len(payload))
-            padding = b"\0" * (63 - len(payload))
-            yield header + payload + padding
-            idx += 63
+        while idx < total:
+            length = min(total - idx, PAYLOAD_SIZE)
+            packet[0] = self._make_header(idx == 0, total - idx < 64, length)
+            packet[1:1 + length] = source[idx:idx + length]
+            if length < PAYLOAD_SIZE:
+                packet[1 + length:] = _ZERO_PADDING[:PAYLOAD_SIZE - length]
+            yield self._tx_packet
+            idx += PAYLOAD_SIZE
 
     def _send_packet(self, packet):
         self.dev.ctrl_transfer(0x21, 9, wValue=0x0300, wIndex=0, data_or_wLength=packet)
 
     def _recv_packet(self, timeout=0):
+        """
+        Read one HID packet into the receive buffer and return the buffer, or
+        None on timeout. The buffer is overwritten by the next read.
+        """
         try:
-            return bytes(self.hid_endpoint.read(64, timeout=timeout))
+            self.hid_endpoint.read(self._rx_packet, timeout=timeout)
+            return self._rx_packet
         except usb.core.USBError as error:
             if hasattr(error, 'errno'):
                 if error.errno == 110:  # Timeout
@@ -111,28 +197,56 @@ class MSR605X:
                     return None
             raise error
 
+    @timed("device.send_message")
     def send_message(self, message):
         """Send a message to the MSR605X."""
         for packet in self._encapsulate_message(message):
             self._send_packet(packet)
 
-    def recv_message(self, timeout=0):
-        """Receive a message from the MSR605X."""
-        message = b""
+    @timed("device.recv_message")
+    def recv_message(self, timeout=0, first_timeout=None):
+        """
+        Receive a message from the MSR605X.
+        first_timeout: how long to wait for the first packet, if different from
+        timeout. Lets callers wait for a swipe in short slices while the rest of
+        a message that has started still gets the full timeout.
+        """
+        rx_view = self._rx_view
+        recv_packet = self._recv_packet
+        packet = recv_packet(timeout=timeout if first_timeout is None else first_timeout)
+        if packet is None:
+            return None  # No data received
+        header = packet[0]
+        if header & SEQUENCE_END_BIT:
+            # Single-packet reply: nothing to reassemble
+            return bytes(rx_view[1:1 + (header & SEQUENCE_LENGTH_BITS)])
+        message = self._rx_message
+        del message[:]
+        message += rx_view[1:1 + (header & SEQUENCE_LENGTH_BITS)]
         while True:
-            packet = self._recv_packet(timeout=timeout)
+            packet = recv_packet(timeout=timeout)
             if packet is None:
-                return None  # No data received
-            payload_length = packet[0] & SEQUENCE_LENGTH_BITS
-            payload = packet[1:1 + payload_length]
-            message += payload
-            if packet[0] & SEQUENCE_END_BIT:
-                break
-        return message
+                return None
+            header = packet[0]
+            # Extends in place (amortized), so long raw mode replies stay linear.
+            message += rx_view[1:1 + (header & SEQUENCE_LENGTH_BITS)]
+            if header & SEQUENCE_END_BIT:
+                return bytes(message)
 
     def reset(self):
-        """Send a reset command to the MSR605X."""
+        """
+        Send a reset command to the MSR605X. ESC a returns the reader to its
+        idle state and cancels a command waiting for a swipe; the BPC, BPI and
+        coercivity settings survive it (configure_device sends it to apply the
+        read BPI). The cached settings are still dropped: reset() is how the
+        host starts over with a reader in an unknown state (a new connection,
+        another process, a command that was given up on), so the next setup is
+        sent in full.
+        """
         self.send_message(ESC + b"a")
+        self.invalidate_config()
+        # A swipe taken just before the reset may still be on its way.
+        self.reply_pending = True
 
     def get_firmware_version(self):
         """Retrieve the firmware version."""
@@ -158,79 +272,249 @@ class MSR605X:
             return response
         return None
 
+    def iter_swipes(self, stop_event=None, idle_timeout=None, poll_interval=250):
+        """
+        Keep the reader armed and yield a SwipeRecord for every swipe.
+        ESC r is re-issued as soon as a response arrives, so the device holds at
+        most one swipe while the caller is busy with the previous one; nothing
+        queues up beyond that. Stops when stop_event (a threading.Event) is set,
+        after idle_timeout seconds without a swipe, or when the generator is
+        closed. The reader is reset and any swipe it already took is dropped on
+        the way out, so it is neither left armed nor leaves a stale reply behind.
+        poll_interval: how often (ms) stop_event and idle_timeout are checked.
+        """
+        try:
+            self.send_message(ESC + b"r")
+            last_swipe = time.monotonic()
+            while stop_event is None or not stop_event.is_set():
+                response = self.recv_message(timeout=1000, first_timeout=poll_interval)
+                if response is None:
+                    if idle_timeout is not None and time.monotonic() - last_swipe >= idle_timeout:
+                        return
+                    continue
+                last_swipe = time.monotonic()
+                self.send_message(ESC + b"r")
+                yield parse_response(response)
+        finally:
+            try:
+                self.reset()
+                self.discard_pending()
+            except usb.core.USBError:
+                pass  # Device already gone
+
+    def discard_pending(self, timeout=50):
+        """Read and drop any replies still queued, e.g. a swipe taken just before a reset."""
+        while self.recv_message(timeout=timeout) is not None:
+            pass
+        self.reply_pending = False
+
+    def batch(self):
+        """Start a CommandBatch on this device."""
+        return CommandBatch(self)
+
+class CommandStatus:
+    """Outcome of one command sent as part of a CommandBatch."""
+    def __init__(self, command, label=None, expect_reply=True):
+        self.command = command
+        self.label = label or command.hex()
+        self.expect_reply = expect_reply
+        self.response = None
+
+    @property
+    def ok(self):
+        """True if the device answered <ESC> 0 (or no answer was expected)."""
+        if not self.expect_reply:
+            return True
+        return self.response is not None and self.response.startswith(ESC + b'0')
+
+    def accepts(self, response):
+        """
+        True if response has the shape of the device's answer to this command:
+        <ESC> 0 <bpc1 bpc2 bpc3> or <ESC> A for ESC o, <ESC> 0 or <ESC> A for
+        ESC b, x and y, and any <ESC> reply for other commands.
+        """
+        if len(response) < 2 or response[:1] != ESC:
+            return False
+        code = self.command[1:2]
+        if code == b'o':
+            return (len(response) == 5 and response[1:2] == b'0') or response == ESC + b'A'
+        if code in (b'b', b'x', b'y'):
+            return response in (ESC + b'0', ESC + b'A')
+        return True
+
+    def __repr__(self):
+        return f"CommandStatus({self.label!r}, ok={self.ok}, response={self.response!r})"
+
+class CommandBatch:
+    """
+    Queue of framed commands that are written back-to-back, after which the
+    replies are read and matched to the commands in order. The device answers
+    commands in the order it receives them, so a whole setup sequence costs a
+    single round-trip window instead of one per command.
+    """
+    def __init__(self, msr):
+        self.msr = msr
+        self.statuses = []
+
+    def add(self, command, label=None, expect_reply=True):
+        """Queue a command and return the CommandStatus that will hold its reply."""
+        status = CommandStatus(command, label, expect_reply)
+        self.statuses.append(status)
+        return status
+
+    def execute(self, timeout=2000):
+        """
+        Send every queued command, then collect the replies. Returns the statuses.
+        Replies are matched to commands by position, so input still queued from
+        an earlier command (e.g. the late answer to a timed-out swipe) is
+        drained first. A reply without the shape its command expects is not
+        taken as its status: if a later command accepts it, this command's
+        reply counts as missing; otherwise the reply is skipped.
+        """
+        if not self.statuses:
+            return self.statuses
+        # Wait for a late reply only after a reset; otherwise just take what has arrived.
+        self.msr.discard_pending(timeout=50 if self.msr.reply_pending else 1)
+        for status in self.statuses:
+            self.msr.send_message(status.command)
+        waiting = [status for status in self.statuses if status.expect_reply]
+        carried = None
+        for index, status in enumerate(waiting):
+            while True:
+                response = carried if carried is not None else self.msr.recv_message(timeout=timeout)
+                carried = None
+                if response is None or status.accepts(response):
+                    status.response = response
+                    break
+                if any(later.accepts(response) for later in waiting[index + 1:]):
+                    carried = response  # The reply to this command never came
+                    break
+                print(f"Skipping unexpected reply to {status.label}: {response!r}")
+        return self.statuses
+
 # Helper function to release the device.
 def finalize_device(msr):
     usb.util.dispose_resources(msr.dev)
 
+# Helper functions for hosts with several readers.
+def find_devices(**kwargs):
+    """Return every attached MSR605X (usb.core.Device), or every device matching kwargs."""
+    if "idVendor" not in kwargs:
+        kwargs["idVendor"] = 0x0801
+        kwargs["idProduct"] = 0x0003
+    with timed("device.find"):
+        return list(_usb_find(find_all=True, **kwargs))
+
+def device_key(dev):
+    """
+    Stable name for a reader: "<bus>-<port path>" (the name of its sysfs entry
+    on Linux), plus "/<serial>" if the device reports a serial number. Unlike
+    the address, the port path stays the same when the reader is unplugged and
+    plugged back into the same port.
+    """
+    ports = getattr(dev, "port_numbers", None)
+    key = f"{dev.bus}-{'.'.join(str(port) for port in ports)}" if ports else f"{dev.bus}-@{dev.address}"
+    if getattr(dev, "iSerialNumber", 0):
+        try:
+            key += "/" + usb.util.get_string(dev, dev.iSerialNumber)
+        except (usb.core.USBError, ValueError, NotImplementedError):
+            pass  # Serial not readable without access rights
+    return key
+
 # Utility functions
 
+@timed("device.configure")
+def configure_device(msr, mode=None, coercivity=None, bpc=BPC_SETTING):
+    """
+    Apply the BPC/BPI setup for mode ('read' or 'write') and the coercivity
+    ('hi' or 'low') in one CommandBatch. Either may be None to leave it as is.
+    bpc is sent along with the BPI setup (RAW_BPC_SETTING for raw mode).
+    Settings the device already has (as cached on msr) are not sent again.
+    Returns the CommandStatus of each command that was sent.
+    """
+    if mode is not None and mode not in BPI_SETTINGS:
+        raise ValueError("Mode must be 'read' or 'write'")
+    if coercivity is not None:
+        coercivity = coercivity.lower()
+        if coercivity not in COERCIVITY_COMMANDS:
+            raise ValueError("Invalid coercivity mode. Choose 'hi' or 'low'.")
+
+    batch = msr.batch()
+    bpc_status = None
+    bpi_statuses = []
+    coercivity_status = None
+    if mode is not None:
+        if msr.bpc != bpc:
+            bpc_status = batch.add(ESC + b'o' + bpc, "BPC Set")
+        for track, setting in enumerate(BPI_SETTINGS[mode]):
+            if msr.bpi[track] != setting:
+                status = batch.add(ESC + b'b' + bytes([setting]), f"Track {track + 1} BPI")
+                bpi_statuses.append((track, setting, status))
+    if coercivity is not None and msr.coercivity != coercivity:
+        command, label = COERCIVITY_COMMANDS[coercivity]
+        coercivity_status = batch.add(command, label)
+
+    statuses = batch.execute(timeout=2000)
+
+    if bpc_status is not None:
+        print(f"BPC Set ACK: {bpc_status.response.hex() if bpc_status.response else 'No response'}")
+        if bpc_status.ok:
+            msr.bpc = bpc
+    for track, setting, status in bpi_statuses:
+        print(f"Track {track + 1} BPI ACK: {status.response}")
+        if status.ok:
+            msr.bpi[track] = setting
+    if coercivity_status is not None:
+        if coercivity_status.ok:
+            print(f"Coercivity set to {coercivity_status.label}")
+            msr.coercivity = coercivity
+        else:
+            print(f"Failed to set {coercivity_status.label}")
+    if mode == "read" and bpi_statuses:
+        # Reset to apply settings. The BPI values (and the cache) stay as set.
+        msr.send_message(ESC + b'a')
+        time.sleep(0.5)
+    return statuses
+
 def set_bpc_bpi(msr, mode="read"):
     """
     Set the BPC and BPI for better swipe detection.
     mode: 'read' for 75 BPI or 'write' for 210 BPI.
     """
-    msr.send_message(ESC + b'o' + bytes([0x07, 0x05, 0x05]))
-    bpc_ack = msr.recv_message(timeout=2000)
-    print(f"BPC Set ACK: {bpc_ack.hex() if bpc_ack else 'No response'}")
-    if mode == "read":
-        msr.send_message(ESC + b'b' + b'\xA0')  # Track 1 - 75 BPI
-        print(f"Track 1 BPI ACK: {msr.recv_message(timeout=2000)}")
-        msr.send_message(ESC + b'b' + b'\x4B')  # Track 2 - 75 BPI
-        print(f"Track 2 BPI ACK: {msr.recv_message(timeout=2000)}")
-        msr.send_message(ESC + b'b' + b'\xC0')  # Track 3 - 75 BPI
-        print(f"Track 3 BPI ACK: {msr.recv_message(timeout=2000)}")
-        # Reset to apply settings.
-        msr.send_message(ESC + b'a')
-        time.sleep(0.5)
-    elif mode == "write":
-        msr.send_message(ESC + b'b' + b'\xA1')  # Track 1 - 210 BPI
-        print(f"Track 1 BPI ACK: {msr.recv_message(timeout=2000)}")
-        msr.send_message(ESC + b'b' + b'\xD2')  # Track 2 - 210 BPI
-        print(f"Track 2 BPI ACK: {msr.recv_message(timeout=2000)}")
-        msr.send_message(ESC + b'b' + b'\xC1')  # Track 3 - 210 BPI
-        print(f"Track 3 BPI ACK: {msr.recv_message(timeout=2000)}")
-    else:
+    if mode not in BPI_SETTINGS:
         raise ValueError("Mode must be 'read' or 'write'")
+    configure_device(msr, mode=mode)
 
 def set_coercivity(msr, mode="hi"):
     """
     Set the coercivity of the card.
     mode: 'hi' for Hi-Co (ESC + x) or 'low' for Low-Co (ESC + y)
     """
-    if mode.lower() == "hi":
-        msr.send_message(ESC + b'x')
-        resp = msr.recv_message(timeout=2000)
-        if resp != ESC + b'0':
-            print("Failed to set Hi-Co")
-        else:
-            print("Coercivity set to Hi-Co")
-    elif mode.lower() == "low":
-        msr.send_message(ESC + b'y')
-        resp = msr.recv_message(timeout=2000)
-        if resp != ESC + b'0':
-            print("Failed to set Low-Co")
-        else:
-            print("Coercivity set to Low-Co")
-    else:
-        raise ValueError("Invalid coercivity mode. Choose 'hi' or 'low'.")
+    configure_device(msr, coercivity=mode)
 
-def get_coercivity_status(msr):
+def get_coercivity_status(msr, refresh=False):
     """
     Retrieve the current coercivity status.
     Sends <ESC> d and checks if the response indicates Hi-Co (H) or Low-Co (L).
+    The cached value is returned without a round trip unless refresh is True.
     """
+    if msr.coercivity is not None and not refresh:
+        return msr.coercivity
     msr.send_message(ESC + b'd')
     resp = msr.recv_message(timeout=2000)
     if resp and len(resp) >= 2:
         if resp[1:2] == b'H':
+            msr.coercivity = "hi"
             return "hi"
         elif resp[1:2] == b'L':
+            msr.coercivity = "low"
             return "low"
     return "unknown"
 
-def erase_card(msr, select_byte):
+def erase_card(msr, select_byte, timeout=10):
     """
-    Erase card data using the erase command.
+    Erase card data using the erase command, waiting up to timeout seconds
+    for the swipe.
     [Select Byte] is a byte specifying which tracks to erase:
       0x00: Track 1 only
       0x02: Track 2 only
@@ -239,15 +523,27 @@ def erase_card(msr, select_byte):
       0x05: Track 1 & 3
       0x06: Track 2 & 3
       0x07: Track 1, 2 & 3
+    Returns True on success, False if the device reported a failure and
+    None on an unexpected or missing response.
     """
     msr.send_message(ESC + b'c' + bytes([select_byte]))
-    resp = msr.recv_message(timeout=2000)
+    print("Erase command sent. Swipe the card...", flush=True)
+    resp = msr.recv_message(timeout=timeout * 1000)
     if resp == ESC + b'0':
         print("Erase successful!")
+        return True
     elif resp == ESC + b'A':
         print("Erase failed!")
+        return False
+    if resp is None:
+        print("Erase operation timed out or no status response received.")
     else:
         print("Unexpected response:", resp)
+    # Disarm the reader so a late swipe neither erases the card anyway nor
+    # leaves its reply to be taken as the answer to the next command.
+    msr.reset()
+    msr.discard_pending()
+    return None
 
 def parse_tracks_arg(tracks_str):
     """
@@ -322,19 +618,201 @@ def parse_and_clean_tracks(raw_data):
         cleaned[track_name] = track_value
     return cleaned
 
+# Track data validation (ISO 7811 character sets)
+# In ISO mode (ESC r, ESC w) the device adds and checks parity and the LRC
+# itself and the host only sees characters, so only the character set and
+# capacity are checked here. Raw mode exposes both; raw_codec checks them with
+# the same tables.
+
+# Maximum characters per track, including the start and end sentinels and the LRC.
+TRACK_CAPACITY = {1: 79, 2: 40, 3: 107}
+
+def _build_track_table(first, data_bits):
+    """
+    256-entry lookup table from an ASCII byte to its encoded character: the
+    data bits with the odd parity bit above them. Bytes outside the character
+    set map to 0, which no valid character encodes to.
+    """
+    table = bytearray(256)
+    for code in range(1 << data_bits):
+        parity = 1 - bin(code).count("1") % 2
+        table[first + code] = code | (parity << data_bits)
+    return bytes(table)
+
+# Track 1 is alphanumeric (0x20-0x5F, 6 data bits), tracks 2 and 3 numeric (0x30-0x3F, 4 data bits).
+TRACK_TABLES = {
+    1: _build_track_table(0x20, 6),
+    2: _build_track_table(0x30, 4),
+    3: _build_track_table(0x30, 4),
+}
+_START_SENTINELS = {1: b"%", 2: b";", 3: b";"}
+
+class TrackDataError(ValueError):
+    """Track data that cannot be written; problems lists every issue found."""
+    def __init__(self, problems):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+def _strip_sentinels(track, data):
+    if data.startswith(_START_SENTINELS[track]):
+        data = data[1:]
+    if data.endswith(b"?"):
+        data = data[:-1]
+    return data
+
+def validate_track(track, data):
+    """
+    Check one track (str or bytes, with or without sentinels) against its
+    character set and capacity. Returns a list of problems, empty if the
+    track can be written.
+    """
+    name = f"Track {track}"
+    if isinstance(data, str):
+        try:
+            data = data.encode("ascii")
+        except UnicodeEncodeError:
+            return [f"{name} contains non-ASCII characters"]
+    data = _strip_sentinels(track, data)
+    table = TRACK_TABLES[track]
+    problems = []
+    limit = TRACK_CAPACITY[track] - 3
+    if len(data) > limit:
+        problems.append(f"{name} has {len(data)} characters, the maximum is {limit}")
+    if 0 in data.translate(table):
+        invalid = "".join(sorted({chr(byte) for byte in data if not table[byte]}))
+        problems.append(f"{name} contains characters outside its character set: {invalid!r}")
+    for sentinel in (_START_SENTINELS[track], b"?"):
+        if sentinel in data:
+            problems.append(f"{name} contains the sentinel {sentinel.decode()!r} inside its data")
+    return problems
+
+def validate_tracks(track1, track2, track3):
+    """Validate the three tracks of one record. Returns a list of problems."""
+    return validate_track(1, track1) + validate_track(2, track2) + validate_track(3, track3)
+
+def check_tracks(track1, track2, track3):
+    """Raise TrackDataError if the record cannot be written."""
+    problems = validate_tracks(track1, track2, track3)
+    if problems:
+        raise TrackDataError(problems)
+
+def validate_batch(records):
+    """
+    Validate (track1, track2, track3) records. Returns a list of
+    (index, problems) for the records that cannot be written.
+    """
+    invalid = []
+    for index, (track1, track2, track3) in enumerate(records):
+        problems = validate_tracks(track1, track2, track3)
+        if problems:
+            invalid.append((index, problems))
+    return invalid
+
+class SwipeRecord(namedtuple("SwipeRecord", "track1 track2 track3 status")):
+    """
+    Cleaned tracks of one read response plus the device status byte
+    (0x30 if the read was OK, None if the response had no status trailer).
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.status == 0x30
+
+    def as_dict(self):
+        """The tracks in the {"Track 1": ..., ...} shape of parse_and_clean_tracks()."""
+        return {"Track 1": self.track1, "Track 2": self.track2, "Track 3": self.track3}
+
+    def validate(self):
+        """Check the tracks that were read against their character sets; returns a list of problems."""
+        return validate_tracks(self.track1, self.track2, self.track3)
+
+_STATUS_TRAILER = FS + ESC
+
+def parse_response(data):
+    """
+    Parse a raw read response (bytes from recv_message) into a SwipeRecord.
+    The status comes from the FS ESC [status] trailer, then the data is split
+    once on ESC and each section is assigned by its 0x01/0x02/0x03 marker, so
+    an empty track can never shift the data of the following one. Start (% or ;)
+    and end (?) sentinels are removed from the track values.
+    """
+    tracks = ["", "", ""]
+    status = None
+    end = data.rfind(_STATUS_TRAILER)
+    if end != -1 and end + 2 < len(data):
+        status = data[end + 2]
+        if end > 0 and data[end - 1] == 0x3F:
+            end -= 1  # '?' closing the data block
+        data = data[:end]
+    for section in data.split(ESC):
+        if section and 0 < section[0] <= 3:
+            start = 2 if section[1:2] in (b"%", b";") else 1
+            stop = -1 if section[-1] == 0x3F and len(section) > start else len(section)
+            tracks[section[0] - 1] = section[start:stop].decode("ascii", errors="ignore")
+    return SwipeRecord(tracks[0], tracks[1], tracks[2], status)
+
+# Status bytes sent by the device after a read, write or erase (section 7).
+STATUS_MESSAGES = {
+    0x30: "OK",
+    0x31: "Write or read error",
+    0x32: "Command format error",
+    0x34: "Invalid command",
+    0x39: "Invalid card swipe when in write mode",
+}
+
+class WriteResult:
+    """Outcome of waiting for a write status: the status byte and the time it took."""
+    def __init__(self, status=None, elapsed=0.0):
+        self.status = status    # Device status byte, None if nothing arrived in time
+        self.elapsed = elapsed  # Seconds spent waiting for the status
+
+    @property
+    def success(self):
+        return self.status == 0x30
+
+    @property
+    def timed_out(self):
+        return self.status is None
+
+    @property
+    def error_code(self):
+        """The device's error status byte, or None on success or timeout."""
+        if self.success or self.timed_out:
+            return None
+        return self.status
+
+    def describe(self):
+        if self.timed_out:
+            return "timed out"
+        return STATUS_MESSAGES.get(self.status, f"Unknown status {hex(self.status)}")
+
+    def __repr__(self):
+        return f"WriteResult(status={self.status!r}, success={self.success}, elapsed={self.elapsed:.3f})"
+
 def wait_for_write_completion(msr, timeout=10):
-    """Wait for the write operation to complete by polling for a status."""
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        response = msr.recv_message(timeout=500)
+    """
+    Wait up to timeout seconds for the status the device sends once the card
+    has been swiped. Blocks in the USB read itself, so it returns as soon as
+    the status packet arrives. Returns a WriteResult.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return WriteResult(None, time.monotonic() - start)
+        # None here is either the deadline or an ignored overflow; the loop sorts it out.
+        response = msr.recv_message(timeout=max(1, int(remaining * 1000)))
         if response and len(response) > 1:
-            status = response[1]
-            return status
-        time.sleep(0.1)
-    return None
+            return WriteResult(response[1], time.monotonic() - start)
 
-def write_card(msr, track1, track2, track3):
-    """Write card data using the specified track data."""
+def build_write_command(track1, track2, track3):
+    """
+    Build the ESC w command carrying the given track data (bytes).
+    Raises TrackDataError if a track cannot be written.
+    """
+    check_tracks(track1, track2, track3)
     data_block = (
         ESC + b's' +
         ESC + b'\x01' + track1 +
@@ -342,41 +820,320 @@ def write_card(msr, track1, track2, track3):
         ESC + b'\x03' + track3 +
         b'?' + FS
     )
-    msr.send_message(ESC + b'w' + data_block)
+    return ESC + b'w' + data_block
+
+def write_card(msr, track1, track2, track3, timeout=10):
+    """
+    Write card data using the specified track data, waiting up to timeout
+    seconds for the swipe. Returns a WriteResult.
+    """
+    return _send_write(msr, build_write_command(track1, track2, track3), timeout)
+
+def _send_write(msr, command, timeout):
+    """Send a write command (ESC w or ESC n) and wait for its status."""
+    msr.send_message(command)
     print("Write command sent. Swipe the card...", flush=True)
-    status = wait_for_write_completion(msr)
-    if status is not None:
-        if status == 0x30:
-            print("Write successful!")
-        else:
-            print(f"Write failed. Status code: {hex(status)}")
-    else:
+    result = wait_for_write_completion(msr, timeout)
+    if result.success:
+        print("Write successful!")
+    elif result.timed_out:
         print("Write operation timed out or no status response received.")
+        # Disarm the reader so a late swipe does not write the card anyway.
+        msr.reset()
+    else:
+        print(f"Write failed. Status code: {hex(result.status)} ({result.describe()})")
+    return result
+
+class VerifyResult:
+    """Outcome of a write followed by a read-back of the same card."""
+    def __init__(self, write, record=None, mismatches=None):
+        self.write = write                  # WriteResult of the write itself
+        self.record = record                # SwipeRecord read back, None if nothing was read
+        self.mismatches = mismatches or []  # Differences between the requested and the read tracks
+
+    @property
+    def success(self):
+        """True if the write itself succeeded (see verified for the read-back)."""
+        return self.write.success
+
+    @property
+    def verified(self):
+        return self.write.success and self.record is not None and not self.mismatches
+
+    def describe(self):
+        if not self.write.success:
+            return self.write.describe()
+        return "; ".join(self.mismatches) if self.mismatches else "OK"
 
-def read_card_data():
+    def __repr__(self):
+        return f"VerifyResult(write={self.write!r}, verified={self.verified}, mismatches={self.mismatches!r})"
+
+def compare_tracks(record, track1, track2, track3):
+    """
+    Compare a SwipeRecord read back from a card with the tracks (bytes, with
+    or without sentinels) that were written to it. Returns a list of
+    mismatches, empty if every track reads back as written.
+    """
+    mismatches = []
+    if not record.ok:
+        status = hex(record.status) if record.status is not None else "missing"
+        mismatches.append(f"Read-back status {status} ({STATUS_MESSAGES.get(record.status, 'no status')})")
+    for track, (expected, actual) in enumerate(zip((track1, track2, track3), record[:3]), start=1):
+        expected = _strip_sentinels(track, expected).decode("ascii", errors="ignore")
+        if expected != actual:
+            mismatches.append(f"Track {track}: wrote {expected!r}, read {actual!r}")
+    return mismatches
+
+def write_and_verify(msr, track1, track2, track3, timeout=10):
+    """
+    Write the tracks, then read the same card back (ESC r) in the same
+    session and compare it field by field. The read-back follows the write
+    status directly, without a reset or a BPC/BPI change, so verifying costs
+    one more swipe and nothing else. Returns a VerifyResult.
+    """
+    result = write_card(msr, track1, track2, track3, timeout)
+    if not result.success:
+        return VerifyResult(result)
+    msr.send_message(ESC + b"r")
+    print("Swipe the card again to verify...", flush=True)
+    response = msr.recv_message(timeout=timeout * 1000)
+    if not response:
+        # No swipe: disarm the reader so a late swipe is not taken as the next reply.
+        msr.reset()
+        return VerifyResult(result, None, ["No card swiped for verification"])
+    record = parse_response(response)
+    verify = VerifyResult(result, record, compare_tracks(record, track1, track2, track3))
+    print("Verified." if verify.verified else f"Verification failed: {verify.describe()}")
+    return verify
+
+def parse_raw_response(data):
+    """
+    Parse a raw mode read response (ESC m) into a SwipeRecord of bytes.
+    Raw track data can contain any byte value, ESC included, so each track is
+    taken by the length byte that follows its ESC 0x01/0x02/0x03 marker.
+    """
+    tracks = [b"", b"", b""]
+    status = None
+    end = data.rfind(_STATUS_TRAILER)
+    if end != -1 and end + 2 < len(data):
+        status = data[end + 2]
+    position = data.find(ESC + b's')
+    if position != -1:
+        position += 2
+        while position + 2 < len(data) and data[position:position + 1] == ESC and 0 < data[position + 1] <= 3:
+            track = data[position + 1]
+            length = data[position + 2]
+            tracks[track - 1] = data[position + 3:position + 3 + length]
+            position += 3 + length
+    return SwipeRecord(tracks[0], tracks[1], tracks[2], status)
+
+def read_raw_tracks(msr, timeout=10000):
+    """
+    Arm the reader in raw mode (ESC m) and wait up to timeout ms for a swipe.
+    Apply RAW_BPC_SETTING first (configure_device(msr, "read", bpc=RAW_BPC_SETTING)).
+    Returns a SwipeRecord with the undecoded bytes of each track (see
+    raw_codec.decode_tracks), or None if no card was swiped.
+    """
+    msr.send_message(ESC + b'm')
+    response = msr.recv_message(timeout=timeout)
+    if response:
+        return parse_raw_response(response)
+    # No swipe: disarm the reader so a late swipe is not taken as the next reply.
+    msr.reset()
+    return None
+
+def build_raw_write_command(raw1, raw2, raw3):
+    """Build the ESC n command carrying raw track bytes (see raw_codec.encode_tracks)."""
+    data_block = ESC + b's'
+    for track, raw in enumerate((raw1, raw2, raw3), start=1):
+        if len(raw) > 0xFF:
+            raise ValueError(f"Raw data for track {track} is longer than 255 bytes")
+        data_block += ESC + bytes([track, len(raw)]) + raw
+    return ESC + b'n' + data_block + b'?' + FS
+
+def write_raw_card(msr, raw1, raw2, raw3, timeout=10):
+    """
+    Write raw track bytes to the next swiped card, waiting up to timeout
+    seconds. Apply RAW_BPC_SETTING first (configure_device(msr, "write",
+    bpc=RAW_BPC_SETTING)). Returns a WriteResult.
+    """
+    return _send_write(msr, build_raw_write_command(raw1, raw2, raw3), timeout)
+
+def _read_swipe(msr, timeout=10000):
+    """Arm the reader, wait for a swipe and return the cleaned track data."""
+    print("Sending read command for all tracks...")
+    msr.send_message(ESC + b"r")
+    print("Swipe a card to read data...")
+    response = msr.recv_message(timeout=timeout)
+    if response:
+        print("\nRaw Card Data:", response.decode('ascii', errors='ignore'))
+        return parse_response(response).as_dict()
+    # No swipe: disarm the reader so a late swipe is not taken as the next reply.
+    msr.reset()
+    return {"Track 1": "", "Track 2": "", "Track 3": ""}
+
+def _write_swipe(msr, track1, track2, track3, coercivity="hi", verify=False):
+    """Apply the write setup and write the given tracks to the next swiped card."""
+    configure_device(msr, mode="write", coercivity=coercivity)
+    if verify:
+        return write_and_verify(msr, track1, track2, track3)
+    return write_card(msr, track1, track2, track3)
+
+def read_card_data(session=None):
     """
     High-level function for reading and returning cleaned track data.
     Returns a dict: {"Track 1": <cleaned>, "Track 2": <cleaned>, "Track 3": <cleaned>}
+    If a DeviceSession is given, its open device is used instead of opening a new one,
+    and concurrent calls on that session share one armed read and get the same swipe.
     """
+    if session is not None:
+        return session.flights.do("read", lambda: session.run(_read_swipe, mode="read"))
     msr = MSR605X()
     msr.connect()
     msr.reset()
     print("MSR605X connected and ready.")
     set_bpc_bpi(msr, mode="read")
-    print("Sending read command for all tracks...")
-    msr.send_message(ESC + b"r")
-    print("Swipe a card to read data...")
-    response = msr.recv_message(timeout=10000)
-    if response:
-        raw_data = response.decode('ascii', errors='ignore')
-        print("\nRaw Card Data:", raw_data)
-        cleaned_tracks = parse_and_clean_tracks(raw_data)
-    else:
-        cleaned_tracks = {"Track 1": "", "Track 2": "", "Track 3": ""}
+    cleaned_tracks = _read_swipe(msr)
     # Release the device resources so it’s not left busy
     finalize_device(msr)
     return cleaned_tracks
 
+def write_card_data(track1, track2, track3, coercivity="hi", session=None, verify=False):
+    """
+    High-level function for writing track data (bytes) to the next swiped card.
+    Returns a WriteResult, or a VerifyResult if verify is set (the card is
+    then swiped a second time and read back, see write_and_verify).
+    If a DeviceSession is given, its open device is used instead of opening a new one.
+    Raises TrackDataError before touching the device if a track cannot be written.
+    """
+    check_tracks(track1, track2, track3)
+    if session is not None:
+        return session.run(lambda msr: _write_swipe(msr, track1, track2, track3, coercivity, verify))
+    msr = MSR605X()
+    msr.connect()
+    msr.reset()
+    result = _write_swipe(msr, track1, track2, track3, coercivity, verify)
+    finalize_device(msr)
+    return result
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key: while a call is running, further calls
+    with the same key wait for it and get its result (or exception) instead of
+    starting their own. A call that starts after it returned runs again.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+        if not leader:
+            return call.result()
+        try:
+            result = function()
+        except BaseException as e:
+            self._finish(key)
+            call.set_exception(e)
+            raise
+        self._finish(key)
+        call.set_result(result)
+        return result
+
+    def _finish(self, key):
+        # Forget the call before publishing its outcome, so no late caller joins a finished call.
+        with self.lock:
+            del self.calls[key]
+
+def _should_reconnect(error):
+    """Return True if a USBError means the device handle has to be reopened."""
+    # I/O error or No such device (unplugged), Resource busy (claimed by another process)
+    return getattr(error, 'errno', None) in (5, 16, 19)
+
+class DeviceSession:
+    """
+    Long-lived MSR605X connection owned by a service process.
+
+    The device is found, connected and reset on first use and then kept between
+    requests, so warm requests skip usb.core.find(), connect(), reset() and the
+    BPC/BPI setup and go straight to the read or write command. If the reader was
+    unplugged, the operation is retried once on a fresh connection.
+
+    exclusive: keep the USB interface claimed between requests. Pass False when
+    another process (e.g. the write service next to the read service) also uses
+    the reader: the interface is then released after every operation and the
+    configuration cache is dropped, since the other process may change it.
+    Warm requests then still pay the BPC/BPI setup, and reads also the ESC a
+    that applies it and its 0.5 s wait; only find, connect and reset are saved.
+
+    registry: a DeviceRegistry to take the device handle from instead of
+    scanning the bus, and key the reader to use (None for any reader).
+
+    flights: a SingleFlight for operations that concurrent callers can share
+    (read_card_data uses it, so simultaneous reads arm the reader once).
+    """
+    def __init__(self, exclusive=True, registry=None, key=None, **kwargs):
+        self.exclusive = exclusive
+        self.registry = registry
+        self.key = key
+        self.device_kwargs = kwargs
+        self.msr = None
+        self.lock = threading.RLock()
+        self.flights = SingleFlight()
+
+    def open(self):
+        """Open and reset the device if it is not open yet."""
+        with self.lock:
+            if self.msr is None:
+                dev = self.registry.get(self.key) if self.registry is not None else None
+                msr = MSR605X(dev=dev, **self.device_kwargs)
+                msr.connect()
+                msr.reset()
+                print("MSR605X connected and ready.")
+                self.msr = msr
+            return self.msr
+
+    def close(self):
+        """Release the device; the next operation opens it again."""
+        with self.lock:
+            if self.msr is not None:
+                try:
+                    finalize_device(self.msr)
+                except usb.core.USBError:
+                    pass  # Already gone
+            self.msr = None
+
+    def run(self, operation, mode=None):
+        """
+        Call operation(msr) on the open device and return its result.
+        mode: 'read' or 'write' to apply the matching BPC/BPI setup first, or None.
+        Calls are serialized, so concurrent requests never share the device.
+        """
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    msr = self.open()
+                    if mode is not None:
+                        set_bpc_bpi(msr, mode=mode)
+                    return operation(msr)
+                except usb.core.USBError as e:
+                    if attempt or not _should_reconnect(e):
+                        raise
+                    print(f"MSR605X unavailable ({e}); reconnecting...")
+                    self.close()
+                    if self.registry is not None:
+                        # The handle may belong to a reader that was unplugged.
+                        self.registry.invalidate(self.key)
+                finally:
+                    if not self.exclusive and self.msr is not None:
+                        # Hand the interface back; pyusb reclaims it on the next transfer.
+                        usb.util.dispose_resources(self.msr.dev)
+                        self.msr.invalidate_config()
+
 def main():
     parser = argparse.ArgumentParser(description="MSR605X read/write/erase utility")
     subparsers = parser.add_subparsers(dest="mode", required=True)
@@ -390,13 +1147,33 @@ def main():
     write_parser.add_argument("--track2", required=True, help="Data for Track 2")
     write_parser.add_argument("--track3", required=True, help="Data for Track 3")
     write_parser.add_argument("--coercivity", choices=["hi", "low"], default="hi", help="Coercivity mode to use (hi or low)")
+    write_parser.add_argument("--verify", action="store_true", help="Read the card back after writing (a second swipe) and compare")
 
     # Erase sub-command requires tracks specification.
     erase_parser = subparsers.add_parser("erase", help="Erase card data")
     erase_parser.add_argument("--tracks", default="all", help="Tracks to erase (e.g., '1', '2', '3', '1,2', '1,3', '2,3', 'all')")
 
+    # Stream sub-command keeps the reader armed and prints every swipe.
+    stream_parser = subparsers.add_parser("stream", help="Read cards continuously until interrupted")
+    stream_parser.add_argument("--count", type=int, default=None, help="Stop after this many swipes")
+    stream_parser.add_argument("--idle-timeout", type=float, default=None, help="Stop after this many seconds without a swipe")
+
+    # Raw sub-commands go through the bit-level codec in raw_codec.py.
+    subparsers.add_parser("read-raw", help="Read raw card data and decode it")
+    write_raw_parser = subparsers.add_parser("write-raw", help="Encode track data and write it in raw mode")
+    write_raw_parser.add_argument("--track1", default="", help="Data for Track 1")
+    write_raw_parser.add_argument("--track2", default="", help="Data for Track 2")
+    write_raw_parser.add_argument("--track3", default="", help="Data for Track 3")
+    write_raw_parser.add_argument("--coercivity", choices=["hi", "low"], default="hi", help="Coercivity mode to use (hi or low)")
+
     args = parser.parse_args()
 
+    if args.mode == "write":
+        # Check the track data before connecting, so a bad track never costs a swipe.
+        problems = validate_tracks(args.track1, args.track2, args.track3)
+        if problems:
+            parser.error("; ".join(problems))
+
     msr = MSR605X()
     msr.connect()
     msr.reset()
@@ -409,26 +1186,31 @@ def main():
         print("Swipe a card to read data...")
         response = msr.recv_message(timeout=10000)
         if response:
-            data = response.decode('ascii', errors='ignore')
-            print("\nRaw Card Data:", data)
-            tracks = parse_track_data(data)
-            for track_name, track_data in tracks.items():
+            print("\nRaw Card Data:", response.decode('ascii', errors='ignore'))
+            # Same parser as the services, so the CLI reports the same tracks.
+            record = parse_response(response)
+            for track_name, track_data in record.as_dict().items():
                 if track_data:
                     print(f"{track_name}: {track_data}")
                 else:
                     print(f"{track_name}: No data")
+            if not record.ok:
+                status = hex(record.status) if record.status is not None else "missing"
+                print(f"Read status: {status} ({STATUS_MESSAGES.get(record.status, 'no status')})")
         else:
             print("No data read from the card. Please try again.")
     elif args.mode == "write":
-        set_bpc_bpi(msr, mode="write")
-        set_coercivity(msr, mode=args.coercivity)
+        configure_device(msr, mode="write", coercivity=args.coercivity)
         current_coercivity = get_coercivity_status(msr)
         print(f"Current coercivity status: {current_coercivity}")
         # Convert track data to bytes.
         track1_data = args.track1.encode()
         track2_data = args.track2.encode()
         track3_data = args.track3.encode()
-        write_card(msr, track1_data, track2_data, track3_data)
+        if args.verify:
+            write_and_verify(msr, track1_data, track2_data, track3_data)
+        else:
+            write_card(msr, track1_data, track2_data, track3_data)
     elif args.mode == "erase":
         set_bpc_bpi(msr, mode="write")
         sel_byte = parse_tracks_arg(args.tracks)
@@ -437,6 +1219,49 @@ def main():
         else:
             print(f"Erasing tracks with select byte: {hex(sel_byte)}")
             erase_card(msr, sel_byte)
+    elif args.mode == "stream":
+        set_bpc_bpi(msr, mode="read")
+        print("Streaming swipes; press Ctrl+C to stop...", flush=True)
+        swipes = msr.iter_swipes(idle_timeout=args.idle_timeout)
+        count = 0
+        try:
+            for record in swipes:
+                count += 1
+                tracks = " | ".join(f"{name}: {value or 'No data'}" for name, value in record.as_dict().items())
+                status = "" if record.ok else f" (status {hex(record.status) if record.status is not None else 'missing'})"
+                problems = record.validate()
+                if problems:
+                    status += f" [{'; '.join(problems)}]"
+                print(f"Swipe {count}: {tracks}{status}", flush=True)
+                if args.count is not None and count >= args.count:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            swipes.close()
+        print(f"Stopped after {count} swipe(s).")
+    elif args.mode == "read-raw":
+        from raw_codec import decode_tracks
+        configure_device(msr, mode="read", bpc=RAW_BPC_SETTING)
+        print("Swipe a card to read raw data...")
+        record = read_raw_tracks(msr)
+        if record is None:
+            print("No data read from the card. Please try again.")
+        else:
+            for track, raw in enumerate(record[:3], start=1):
+                decoded = decode_tracks([raw], track)[0]
+                print(f"Track {track} raw: {raw.hex() or 'No data'}")
+                if decoded.value:
+                    notes = [] if decoded.lrc_ok else ["LRC mismatch"]
+                    if decoded.parity_errors:
+                        notes.append(f"parity errors at {decoded.parity_errors}")
+                    print(f"Track {track}: {decoded.value}" + (f" ({', '.join(notes)})" if notes else ""))
+    elif args.mode == "write-raw":
+        from raw_codec import encode_tracks
+        raws = [encode_tracks([value], track)[0] for track, value in
+                enumerate((args.track1, args.track2, args.track3), start=1)]
+        configure_device(msr, mode="write", coercivity=args.coercivity, bpc=RAW_BPC_SETTING)
+        write_raw_card(msr, *raws)
 
 if __name__ == "__main__":
     main()
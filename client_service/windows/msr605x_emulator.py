@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Software MSR605X for running the library, the services and the agent without
+a reader attached.
+
+EmulatedDevice stands in for the pyusb usb.core.Device below MSR605X: it takes
+the 64-byte HID reports MSR605X sends with ctrl_transfer(), reassembles the
+ESC commands, and queues framed replies on an emulated interrupt endpoint that
+MSR605X reads from. It implements the commands the library uses (ESC a, v, r,
+w, c, o, b, x, y, d, m, n and 0x86) and keeps a card, so what is written reads
+back:
+
+    dev = EmulatedDevice(swipe_delay=0.2)
+    msr = MSR605X(dev=dev)
+    msr.connect()
+    write_card(msr, b"%ABC?", b";123?", b";456?")
+    dev.card  # (b'%ABC?', b';123?', b';456?')
+
+Knobs for tests and benchmarks:
+  swipe_delay  seconds from arming (read, write, erase, sensor test) until the
+               card is swiped; None waits for swipe() to be called
+  latency      seconds added to every USB transfer, in both directions
+  inject()     fail the next transfers with a USB errno, e.g. 110 (timeout),
+               75 (overflow), 16 (EBUSY) or 19 (unplugged)
+  error_rates  the same at random: {"recv": [(110, 0.01)], "configure": [(16, 0.1)]}
+
+With MSR605X_EMULATOR=1 the library looks readers up here instead of on the
+USB bus, so read_service, write_service, broker_service and the agent run
+unchanged. Environment:
+  MSR605X_EMULATOR_DEVICES      number of emulated readers (default 1)
+  MSR605X_EMULATOR_SWIPE_DELAY  seconds, or "manual" (default 0)
+  MSR605X_EMULATOR_LATENCY      seconds per transfer (default 0)
+  MSR605X_EMULATOR_ERRORS       e.g. "recv:110:0.01,configure:16:0.1"
+"""
+
+import os
+import array
+import queue
+import random
+import threading
+import time
+
+import usb.core
+
+ESC = b"\x1b"
+FS = b"\x1c"
+
+PACKET_SIZE = 64
+PAYLOAD_SIZE = PACKET_SIZE - 1
+
+VENDOR_ID = 0x0801
+PRODUCT_ID = 0x0003
+
+FIRMWARE = b"REVH3.15"
+
+DEFAULT_CARD = (b"%EMULATED CARD?", b";1234567890?", b";0987654321?")
+
+# Status bytes of the replies (section 7 of the programmer's manual).
+STATUS_OK = b"0"
+STATUS_WRITE_ERROR = b"1"
+STATUS_INVALID_COMMAND = b"4"
+
+# Transfers that inject() and error_rates can fail.
+OPERATIONS = ("send", "recv", "configure")
+
+def usb_error(errno):
+    """A usb.core.USBError like pyusb raises for errno."""
+    return usb.core.USBError(os.strerror(errno), errno=errno)
+
+class _Context:
+    """Stand-in for pyusb's device context, which usb.util.dispose_resources() calls."""
+    def __init__(self, device):
+        self.device = device
+
+    def dispose(self, device, close_handle=True):
+        self.device.disposals += 1
+
+class EmulatedEndpoint:
+    """Interrupt IN endpoint: hands out the reply packets the device queued."""
+    def __init__(self, device):
+        self.device = device
+        self.wMaxPacketSize = PACKET_SIZE
+
+    def read(self, size_or_buffer, timeout=None):
+        device = self.device
+        device._transfer("recv")
+        if timeout is None:
+            timeout = 1000  # pyusb's default timeout
+        try:
+            # libusb treats a timeout of 0 as "wait forever".
+            packet = device.replies.get(timeout=timeout / 1000 if timeout else None)
+        except queue.Empty:
+            raise usb_error(110) from None
+        if isinstance(size_or_buffer, int):
+            return array.array("B", packet[:size_or_buffer])
+        with memoryview(size_or_buffer) as view:
+            view[:len(packet)] = packet
+        return len(packet)
+
+class _Interface:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    def endpoints(self):
+        return (self.endpoint,)
+
+class _Configuration:
+    def __init__(self, interface):
+        self.interface = interface
+
+    def __getitem__(self, index):
+        return self.interface
+
+class EmulatedDevice:
+    """
+    An MSR605X as seen through pyusb. card holds the three tracks as written
+    (bytes with sentinels). bus, address and port_numbers give the device its
+    key in a DeviceRegistry.
+    """
+    def __init__(self, card=DEFAULT_CARD, swipe_delay=0.0, latency=0.0, error_rates=None,
+                 bus=1, address=2, port_numbers=(1,)):
+        self.idVendor = VENDOR_ID
+        self.idProduct = PRODUCT_ID
+        self.iSerialNumber = 0
+        self.bus = bus
+        self.address = address
+        self.port_numbers = port_numbers
+        self._ctx = _Context(self)
+
+        self.card = tuple(card)
+        self.swipe_delay = swipe_delay
+        self.latency = latency
+        self.error_rates = error_rates or {}
+        self.replies = queue.Queue()
+        self.lock = threading.Lock()
+        self.endpoint = EmulatedEndpoint(self)
+        self.disposals = 0
+        self.commands = 0
+        self.swipes = 0
+        self._faults = {operation: [] for operation in OPERATIONS}
+        self._message = bytearray()
+        self._armed = None   # (command, argument) waiting for a swipe
+        self._timer = None
+        self.reset_state()
+
+    def reset_state(self):
+        """Power-on settings, as after plugging the reader in."""
+        self.bpc = bytes([0x07, 0x05, 0x05])
+        self.bpi = [0xA1, 0xD2, 0xC1]
+        self.coercivity = b"H"
+
+    # Fault injection
+
+    def inject(self, operation, errno, count=1):
+        """Make the next count transfers of operation ("send", "recv" or "configure") fail with errno."""
+        if operation not in OPERATIONS:
+            raise ValueError(f"operation must be one of {', '.join(OPERATIONS)}")
+        with self.lock:
+            self._faults[operation].extend([errno] * count)
+
+    def _transfer(self, operation):
+        """Apply latency and raise the injected or random error of one transfer, if any."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            faults = self._faults[operation]
+            errno = faults.pop(0) if faults else None
+        if errno is None:
+            for rate_errno, rate in self.error_rates.get(operation, ()):
+                if random.random() < rate:
+                    errno = rate_errno
+                    break
+        if errno is not None:
+            raise usb_error(errno)
+
+    # pyusb Device interface used by MSR605X
+
+    def is_kernel_driver_active(self, interface):
+        return False
+
+    def detach_kernel_driver(self, interface):
+        pass
+
+    def set_configuration(self, configuration=None):
+        self._transfer("configure")
+
+    def get_active_configuration(self):
+        return _Configuration(_Interface(self.endpoint))
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0, data_or_wLength=None, timeout=None):
+        self._transfer("send")
+        packet = bytes(data_or_wLength)
+        header = packet[0]
+        if header & 0x80:
+            self._message.clear()
+        self._message += packet[1:1 + (header & 0x3F)]
+        if header & 0x40:
+            message = bytes(self._message)
+            self._message.clear()
+            self.commands += 1
+            self.handle(message)
+        return len(packet)
+
+    # Device side
+
+    def reply(self, message):
+        """Queue message as framed 64-byte packets for the host to read."""
+        offset = 0
+        while True:
+            chunk = message[offset:offset + PAYLOAD_SIZE]
+            header = len(chunk)
+            if offset == 0:
+                header |= 0x80
+            if len(message) - offset <= PAYLOAD_SIZE:
+                header |= 0x40
+            self.replies.put(bytes([header]) + chunk + bytes(PAYLOAD_SIZE - len(chunk)))
+            offset += PAYLOAD_SIZE
+            if offset >= len(message):
+                break
+
+    def handle(self, message):
+        """Run one command received from the host."""
+        if message[:1] != ESC or len(message) < 2:
+            self.reply(ESC + STATUS_INVALID_COMMAND)
+            return
+        command, argument = message[1:2], message[2:]
+        if command == b"a":
+            # Back to idle: a pending command is cancelled, the settings are kept.
+            self._disarm()
+        elif command == b"v":
+            self.reply(ESC + FIRMWARE)
+        elif command == b"o":
+            self.bpc = argument[:3]
+            self.reply(ESC + STATUS_OK + self.bpc)
+        elif command == b"b":
+            self._set_bpi(argument[:1])
+            self.reply(ESC + STATUS_OK)
+        elif command in (b"x", b"y"):
+            self.coercivity = b"H" if command == b"x" else b"L"
+            self.reply(ESC + STATUS_OK)
+        elif command == b"d":
+            self.reply(ESC + self.coercivity)
+        elif command in (b"r", b"w", b"c", b"m", b"n", b"\x86"):
+            self._arm(command, argument)
+        else:
+            self.reply(ESC + STATUS_INVALID_COMMAND)
+
+    def _set_bpi(self, setting):
+        if not setting:
+            return
+        value = setting[0]
+        # Track 2 selectors are 0x4B (75 BPI) and 0xD2 (210 BPI); tracks 1 and 3 use 0xA_ and 0xC_.
+        track = {0xA0: 0, 0xA1: 0, 0x4B: 1, 0xD2: 1, 0xC0: 2, 0xC1: 2}.get(value)
+        if track is not None:
+            self.bpi[track] = value
+
+    def _arm(self, command, argument):
+        with self.lock:
+            self._cancel_timer()
+            self._armed = (command, argument)
+            if self.swipe_delay:
+                self._timer = threading.Timer(self.swipe_delay, self.swipe)
+                self._timer.daemon = True
+                self._timer.start()
+        if self.swipe_delay == 0:
+            self.swipe()  # The card is already in the slot
+
+    def _disarm(self):
+        with self.lock:
+            self._cancel_timer()
+            self._armed = None
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def swipe(self, card=None):
+        """
+        Swipe a card through the reader: card (three tracks as bytes) replaces
+        the current card first. Completes the armed command; returns False if
+        the reader was not armed.
+        """
+        with self.lock:
+            if card is not None:
+                self.card = tuple(card)
+            armed, self._armed = self._armed, None
+            self._timer = None
+            if armed is None:
+                return False
+            self.swipes += 1
+            command, argument = armed
+            if command == b"r":
+                reply = self._read_response()
+            elif command == b"w":
+                reply = self._write(argument)
+            elif command == b"c":
+                reply = self._erase(argument[:1])
+            elif command == b"m":
+                reply = self._raw_read_response()
+            elif command == b"n":
+                reply = self._raw_write(argument)
+            else:
+                reply = ESC + STATUS_OK  # Sensor test: a card went through
+        self.reply(reply)
+        return True
+
+    def _read_response(self):
+        data = ESC + b"s"
+        for track, value in enumerate(self.card, start=1):
+            data += ESC + bytes([track]) + value
+        return data + b"?" + FS + ESC + STATUS_OK
+
+    def _write(self, block):
+        # ESC s ESC 01 track1 ESC 02 track2 ESC 03 track3 ? FS
+        if not block.startswith(ESC + b"s") or not block.endswith(b"?" + FS):
+            return ESC + STATUS_WRITE_ERROR
+        tracks = [b"", b"", b""]
+        for section in block[2:-2].split(ESC):
+            if section and 0 < section[0] <= 3:
+                tracks[section[0] - 1] = section[1:]
+        self.card = tuple(tracks)
+        return ESC + STATUS_OK
+
+    def _erase(self, select):
+        if not select:
+            return ESC + STATUS_WRITE_ERROR
+        select = select[0]
+        tracks = list(self.card)
+        # 0x00 is track 1 alone; otherwise bit 0, 1 and 2 select tracks 1, 2 and 3.
+        for track, erased in enumerate((select == 0 or select & 1, select & 2, select & 4)):
+            if erased:
+                tracks[track] = b""
+        self.card = tuple(tracks)
+        return ESC + STATUS_OK
+
+    def _raw_read_response(self):
+        from raw_codec import encode_tracks
+        data = ESC + b"s"
+        for track, value in enumerate(self.card, start=1):
+            raw = encode_tracks([value.decode("ascii")], track, bitorder="big")[0] if value else b""
+            data += ESC + bytes([track, len(raw)]) + raw
+        return data + b"?" + FS + ESC + STATUS_OK
+
+    def _raw_write(self, block):
+        # ESC s ESC 01 L1 raw1 ESC 02 L2 raw2 ESC 03 L3 raw3 ? FS
+        from raw_codec import decode_tracks
+        tracks = [b"", b"", b""]
+        position = 2
+        while position + 2 < len(block) and block[position:position + 1] == ESC and 0 < block[position + 1] <= 3:
+            track, length = block[position + 1], block[position + 2]
+            raw = block[position + 3:position + 3 + length]
+            tracks[track - 1] = decode_tracks([raw], track, bitorder="little")[0].value.encode("ascii")
+            position += 3 + length
+        self.card = tuple(tracks)
+        return ESC + STATUS_OK
+
+# Readers returned by find() when the library runs with MSR605X_EMULATOR=1.
+
+def parse_error_rates(spec):
+    """Parse "op:errno:rate,..." (see MSR605X_EMULATOR_ERRORS) into an error_rates dict."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        operation, errno, rate = item.split(":")
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation {operation!r} in {spec!r}")
+        rates.setdefault(operation, []).append((int(errno), float(rate)))
+    return rates
+
+def devices_from_environment():
+    """Create the emulated readers described by the MSR605X_EMULATOR_* variables."""
+    delay = os.environ.get("MSR605X_EMULATOR_SWIPE_DELAY", "0")
+    return [
+        EmulatedDevice(
+            swipe_delay=None if delay == "manual" else float(delay),
+            latency=float(os.environ.get("MSR605X_EMULATOR_LATENCY", "0")),
+            error_rates=parse_error_rates(os.environ.get("MSR605X_EMULATOR_ERRORS", "")),
+            port_numbers=(number,),
+            address=number + 1,
+        )
+        for number in range(1, int(os.environ.get("MSR605X_EMULATOR_DEVICES", "1")) + 1)
+    ]
+
+_devices = None
+_devices_lock = threading.Lock()
+
+def attached_devices():
+    """The emulated readers of this process, created on first use."""
+    global _devices
+    with _devices_lock:
+        if _devices is None:
+            _devices = devices_from_environment()
+        return _devices
+
+def find(find_all=False, idVendor=None, idProduct=None, **kwargs):
+    """usb.core.find() over the emulated readers; other keyword arguments (e.g. backend) are ignored."""
+    found = [dev for dev in attached_devices()
+             if idVendor in (None, dev.idVendor) and idProduct in (None, dev.idProduct)]
+    if find_all:
+        return iter(found)
+    return found[0] if found else None
@@ -1,7 +1,12 @@
+import os
 import logging
-from flask import Flask, jsonify, request, make_response
+from flask import Flask, Response, jsonify, request, make_response
 from flask_cors import CORS
-from msr605x import read_card_data
+from werkzeug.serving import WSGIRequestHandler
+from msr605x import read_card_data, DeviceSession
+from device_registry import DeviceRegistry
+from metrics import timed, render, CONTENT_TYPE
+from swipe_stream import SwipeBroadcaster, sse_events
 from waitress import serve
 
 # Setup basic logging
@@ -15,6 +20,23 @@ CORS(app,
      supports_credentials=False,  # set True only if you use cookies/credentials
      max_age=600)
 
+# One device connection for the lifetime of the service. The write service
+# shares the reader, so the USB interface is only held while a request runs
+# unless MSR605X_EXCLUSIVE=1.
+# In that shared (default) mode a warm /read only saves the find, connect and
+# reset: the write service may have changed the settings in between, so every
+# read sends the BPC and three BPI commands again, then ESC a and a 0.5 s
+# wait. Set MSR605X_EXCLUSIVE=1 when this is the only process using the
+# reader, or run broker_service.py instead of the two services, to skip it.
+# The reader's handle comes from a registry that follows hot-plug events, so
+# reconnecting never needs a full bus scan.
+registry = DeviceRegistry().watch()
+session = DeviceSession(exclusive=os.environ.get("MSR605X_EXCLUSIVE") == "1", registry=registry)
+
+# Keeps the reader armed while /swipes clients are connected. The reader (and
+# its USB interface) stays busy until the last client disconnects.
+broadcaster = SwipeBroadcaster(session)
+
 @app.after_request
 def add_pna_headers(resp):
     # Critical for public → localhost requests
@@ -27,16 +49,35 @@ def add_pna_headers(resp):
     return resp
 
 @app.route("/read", methods=["GET", "OPTIONS"])
+@timed("route.read")
 def read():
     if request.method == "OPTIONS":
         # Minimal OK preflight response
         return make_response(("", 204))
     try:
-        data = read_card_data()
+        if broadcaster.active:
+            # The reader is already armed for /swipes; take the next swipe from the stream.
+            swipe = broadcaster.next_swipe(timeout=10) or {}
+            data = {name: swipe.get(name, "") for name in ("Track 1", "Track 2", "Track 3")}
+        else:
+            data = read_card_data(session)
         return jsonify(data)
     except Exception as e:
         app.logger.exception("Error reading card data")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/swipes", methods=["GET"])
+def swipes():
+    # Server-Sent Events: one "swipe" event per card, until the client disconnects
+    return Response(sse_events(broadcaster), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Stage latency histograms of this process (route, configuration, USB transfers)
+    return render(), 200, {"Content-Type": CONTENT_TYPE}
+
 if __name__ == "__main__":
+    # HTTP/1.1 lets the agent's pooled connections (and their TLS sessions) stay open.
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
     app.run(host="127.0.0.1", port=5000, ssl_context=("127.0.0.1+1.pem", "127.0.0.1+1-key.pem"))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for the request deduplication and the in-process dispatch in agent.py.
+
+Run with: python -m pytest client_service
+"""
+
+import msr605x
+import agent
+from agent import RequestCache
+from msr605x import DeviceNotFoundError
+
+
+def test_new_request_is_claimed():
+    cache = RequestCache(ttl=60)
+    future, new = cache.claim("req-1")
+    assert new
+    assert not future.done()
+
+def test_duplicate_while_in_flight_waits_for_first():
+    cache = RequestCache(ttl=0)  # In-flight entries stay regardless of the ttl
+    first, new = cache.claim("req-1")
+    duplicate, duplicate_new = cache.claim("req-1")
+    assert new and not duplicate_new
+    assert duplicate is first
+    cache.complete("req-1", {"status": 200})
+    assert duplicate.result(timeout=1) == {"status": 200}
+
+def test_duplicate_after_completion_gets_cached_response():
+    cache = RequestCache(ttl=60)
+    cache.claim("req-1")
+    cache.complete("req-1", {"status": 200})
+    future, new = cache.claim("req-1")
+    assert not new
+    assert future.result(timeout=1) == {"status": 200}
+
+def test_expired_request_runs_again():
+    cache = RequestCache(ttl=0)
+    first, _ = cache.claim("req-1")
+    cache.complete("req-1", {"status": 200})
+    second, new = cache.claim("req-1")
+    assert new
+    assert second is not first
+    assert not second.done()
+    assert "req-1" in cache.entries
+
+def test_other_ids_are_independent():
+    cache = RequestCache(ttl=60)
+    cache.claim("req-1")
+    _, new = cache.claim("req-2")
+    assert new
+
+
+def _read_raising(monkeypatch, error):
+    def read_card_data(session):
+        raise error
+    monkeypatch.setattr(agent, "get_local_session", lambda: None)
+    monkeypatch.setattr(msr605x, "read_card_data", read_card_data)
+    return agent.do_inprocess_request("GET", "/read")
+
+def test_missing_reader_falls_back_to_http(monkeypatch):
+    assert _read_raising(monkeypatch, DeviceNotFoundError("Device not found. Check connection.")) is None
+
+def test_other_errors_are_reported(monkeypatch):
+    response = _read_raising(monkeypatch, ValueError("Device not found in a different sense"))
+    assert response["status"] == 500
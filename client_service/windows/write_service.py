@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
+import os
 from flask import Flask, request, jsonify, make_response
 from flask_cors import CORS
-from msr605x import MSR605X, set_bpc_bpi, set_coercivity, write_card, finalize_device
+from werkzeug.serving import WSGIRequestHandler
+from msr605x import write_card_data, DeviceSession, TrackDataError
+from device_registry import DeviceRegistry
+from metrics import timed, render, CONTENT_TYPE
 from waitress import serve
 
 app = Flask(__name__)
@@ -11,6 +15,17 @@ CORS(app,
      supports_credentials=False,
      max_age=600)
 
+# One device connection for the lifetime of the service. The read service
+# shares the reader, so the USB interface is only held while a request runs
+# unless MSR605X_EXCLUSIVE=1.
+# In that shared (default) mode a warm /write still sends the BPC, BPI and
+# coercivity setup before ESC w, since the read service may have changed
+# them; MSR605X_EXCLUSIVE=1 or broker_service.py keeps the setup cached.
+# The reader's handle comes from a registry that follows hot-plug events, so
+# reconnecting never needs a full bus scan.
+registry = DeviceRegistry().watch()
+session = DeviceSession(exclusive=os.environ.get("MSR605X_EXCLUSIVE") == "1", registry=registry)
+
 @app.after_request
 def add_pna_headers(resp):
     resp.headers["Access-Control-Allow-Private-Network"] = "true"
@@ -20,6 +35,7 @@ def add_pna_headers(resp):
     return resp
 
 @app.route("/write", methods=["POST", "OPTIONS"])
+@timed("route.write")
 def write():
     if request.method == "OPTIONS":
         return make_response(("", 204))
@@ -29,22 +45,36 @@ def write():
         track2 = data.get("track2", "")
         track3 = data.get("track3", "")
         coercivity = data.get("coercivity", "hi")
+        verify = bool(data.get("verify", False))
 
         if not (track1 and track2 and track3):
             return jsonify({"error": "Missing track data; please supply track1, track2, and track3."}), 400
 
-        msr = MSR605X()
-        msr.connect()
-        msr.reset()
-        set_bpc_bpi(msr, mode="write")
-        set_coercivity(msr, mode=coercivity)
-        write_card(msr, track1.encode(), track2.encode(), track3.encode())
-        finalize_device(msr)
+        result = write_card_data(track1.encode(), track2.encode(), track3.encode(), coercivity, session=session, verify=verify)
+        if not result.success:
+            # No swipe in time, or the device reported an error status.
+            write_result = result.write if verify else result
+            return jsonify({"error": f"Write failed: {result.describe()}", "status": write_result.status}), 500
+        if verify and not result.verified:
+            # Nothing was read back, or the card does not read back as requested.
+            return jsonify({"error": f"Verification failed: {result.describe()}", "mismatches": result.mismatches}), 500
 
+        if verify:
+            return jsonify({"message": "Write action completed", "track3": track3, "verified": True})
         return jsonify({"message": "Write action completed", "track3": track3})
+    except TrackDataError as e:
+        # Rejected before the device was touched; no swipe was requested.
+        return jsonify({"error": str(e), "problems": e.problems}), 400
     except Exception as e:
         app.logger.exception("Error writing card")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Stage latency histograms of this process (route, configuration, USB transfers)
+    return render(), 200, {"Content-Type": CONTENT_TYPE}
+
 if __name__ == "__main__":
+    # HTTP/1.1 lets the agent's pooled connections (and their TLS sessions) stay open.
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
     app.run(host="127.0.0.1", port=5001, ssl_context=("127.0.0.1+1.pem", "127.0.0.1+1-key.pem"))